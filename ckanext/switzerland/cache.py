@@ -0,0 +1,193 @@
+# coding=UTF-8
+
+import time
+import threading
+import functools
+from collections import OrderedDict
+import ckan.plugins.toolkit as tk
+from ckan import model
+
+import logging
+log = logging.getLogger(__name__)
+
+# all caches by name, used to report their statistics
+_caches = OrderedDict()
+
+
+class LRUCache(object):
+    """
+    A process-local, thread-safe cache that holds at most `maxsize` entries
+    and drops the least recently used one when it is full. Entries expire
+    after `ttl` seconds if a ttl is given. Hits and misses are counted
+    so that the cache can be sized.
+    """
+
+    def __init__(self, name, maxsize=1000, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, created = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if self._is_expired(created):
+                self.misses += 1
+                return default
+            # re-insert the entry to mark it as most recently used
+            self._data[key] = (value, created)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time())
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader, refresh_after=None):
+        """
+        Returns the value for key and loads it with loader() if it is
+        not cached. If refresh_after (in seconds) is given, an entry that
+        is older is still returned but reloaded in a background thread.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._is_expired(entry[1]):
+                value, created = entry
+                self._data.pop(key)
+                self._data[key] = entry
+                self.hits += 1
+                if refresh_after and created + refresh_after < time.time() \
+                        and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    thread = threading.Thread(
+                        target=self._refresh, args=(key, loader))
+                    thread.daemon = True
+                    thread.start()
+                return value
+            self.misses += 1
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            self.set(key, loader())
+        except Exception:
+            log.exception('Could not refresh entry %s of cache %s'
+                          % (key, self.name))
+        finally:
+            # the refresh thread has its own scoped database session,
+            # which has to be closed when the thread ends
+            model.Session.remove()
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _is_expired(self, created):
+        return bool(self.ttl) and created + self.ttl < time.time()
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, predicate):
+        """
+        Removes all entries whose key matches the predicate
+        """
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def invalidate_values(self, predicate):
+        """
+        Removes all entries whose value matches the predicate
+        """
+        with self._lock:
+            for key in [k for k, (value, _) in self._data.items()
+                        if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def get_cache_stats():
+    """
+    Returns the statistics of all caches of this process
+    """
+    return [cache.stats() for cache in _caches.values()]
+
+
+def configure_caches(config):
+    """
+    Sets size and ttl of all caches from the config options
+    ckanext.switzerland.<name>_cache_size and
+    ckanext.switzerland.<name>_cache_ttl
+    """
+    for name, cache in _caches.items():
+        prefix = 'ckanext.switzerland.%s_cache_' % name
+        cache.maxsize = tk.asint(config.get(prefix + 'size', cache.maxsize))
+        ttl = config.get(prefix + 'ttl', cache.ttl)
+        cache.ttl = tk.asint(ttl) if ttl else None
+
+
+def get_request_memo(name):
+    """
+    Returns a dict that only lives as long as the current request,
+    or None if there is no request (i.e. on the command line)
+    """
+    try:
+        memos = getattr(tk.c, '_ogdch_memos', None)
+        if not isinstance(memos, dict):
+            memos = {}
+            tk.c._ogdch_memos = memos
+    except (TypeError, RuntimeError, AttributeError):
+        return None
+    return memos.setdefault(name, {})
+
+
+def memoize_per_request(func):
+    """
+    Decorator that computes the result of func only once per request
+    for the same arguments. Calls outside of a request and calls with
+    unhashable arguments are not memoized.
+    """
+    memo_name = 'memoize_%s.%s' % (func.__module__, func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        memo = get_request_memo(memo_name)
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            if memo is not None and key in memo:
+                return memo[key]
+        except TypeError:
+            return func(*args, **kwargs)
+        result = func(*args, **kwargs)
+        if memo is not None:
+            memo[key] = result
+        return result
+    return wrapper
@@ -1,11 +1,22 @@
 import sys
 import os
+import hashlib
+import contextlib
 import itertools
 import traceback
+import multiprocessing
+import tempfile
+import dateutil.parser
 import ckan.lib.cli
+import ckan.lib.search as search
+import ckan.lib.search.index as search_index
+import ckan.plugins as plugins
+from ckan.lib.search.common import make_connection
+from ckan.common import config
 import ckan.logic as logic
 import ckan.model as model
 import helpers as ogdch_helpers
+import linkcheck as ogdch_linkcheck
 import pandas as pd
 
 
@@ -42,6 +53,37 @@ class OgdchCommand(ckan.lib.cli.CkanCommand):
 
         paster ogdch shacl_validate
             {source_id} --shapefile={name of the shape file}
+
+        # Rebuild the search index of the datasets
+        # - the datasets are indexed in parallel by n worker processes,
+        #   each sends batches of b documents to solr, solr is only
+        #   committed to once at the end
+        # - the progress is written to a checkpoint file, an interrupted
+        #   run continues where it stopped when it is started again with
+        #   the same --since and --organization
+        # - the documents of deleted datasets are removed, a run without
+        #   --since and --organization also removes those of purged ones
+        # - the index can be rebuilt only for datasets modified after
+        #   a timestamp and/or only for an organization and its
+        #   suborganizations
+
+        paster ogdch reindex
+            [--workers={n}] [--since={iso timestamp}]
+            [--organization={id or name}] [--checkpoint={path}]
+            [--batch-size={b}]
+
+        # Check the urls and download urls of all resources
+        # - the urls are requested concurrently by n threads, with at
+        #   most m concurrent requests to the same host
+        # - status code, content-length and content-type are stored in
+        #   a table that ogdch_content_headers serves from
+        # - missing byte_size and media_type of resources are filled in
+        #   from content-length and content-type, unless --dryrun is given
+        # - --since and --organization limit the datasets as for reindex
+
+        paster ogdch linkcheck
+            [--threads={n}] [--per-host={m}] [--since={iso timestamp}]
+            [--organization={id or name}] [--dryrun]
     '''
     summary = __doc__.split('\n')[0]
     usage = __doc__
@@ -55,11 +97,43 @@ class OgdchCommand(ckan.lib.cli.CkanCommand):
         self.parser.add_option(
             '--dryrun', action="store_true", dest='dryrun',
             default=False,
-            help='dryrun of cleanup harvestjobs')
+            help='dryrun of cleanup harvestjobs, linkcheck does not '
+                 'update resources')
         self.parser.add_option(
             '--shapefile', action="store", type="string",  dest='shapefile',
             default='ech-0200.shacl.ttl',
             help='shape file name for shacl shape validation')
+        self.parser.add_option(
+            '--workers', action="store", type="int", dest='workers',
+            default=multiprocessing.cpu_count(),
+            help='The number of worker processes for reindex')
+        self.parser.add_option(
+            '--since', action="store", type="string", dest='since',
+            default=None,
+            help='Only reindex datasets modified after this timestamp')
+        self.parser.add_option(
+            '--organization', action="store", type="string",
+            dest='organization', default=None,
+            help='Only reindex datasets of this organization '
+                 'and its suborganizations')
+        self.parser.add_option(
+            '--checkpoint', action="store", type="string",
+            dest='checkpoint', default=None,
+            help='File to record the progress of reindex (default: a file '
+                 'in the temp directory per --since and --organization)')
+        self.parser.add_option(
+            '--batch-size', action="store", type="int", dest='batch_size',
+            default=100,
+            help='The number of datasets reindex sends to solr at once')
+        self.parser.add_option(
+            '--threads', action="store", type="int", dest='threads',
+            default=50,
+            help='The number of concurrent requests of linkcheck')
+        self.parser.add_option(
+            '--per-host', action="store", type="int", dest='per_host',
+            default=4,
+            help='The number of concurrent requests of linkcheck '
+                 'to the same host')
 
     def command(self):
         # load pylons config
@@ -69,6 +143,8 @@ class OgdchCommand(ckan.lib.cli.CkanCommand):
             'help': self.help,
             'cleanup_harvestjobs': self.cleanup_harvestjobs,
             'shacl_validate': self.shacl_validate,
+            'reindex': self.reindex,
+            'linkcheck': self.linkcheck,
         }
 
         try:
@@ -355,3 +431,340 @@ class OgdchCommand(ckan.lib.cli.CkanCommand):
         print(dg.sort_values('count', ascending=False)
               .to_string(index=False))
         print("\n")
+
+    def reindex(self):
+        """
+        command to rebuild the search index of the datasets in parallel
+        """
+        try:
+            package_ids = self._get_package_ids_to_reindex()
+            deleted_ids = self._get_package_ids_to_reindex(state='deleted')
+        except (ValueError, OverflowError):
+            print('Invalid timestamp for --since: {}'
+                  .format(self.options.since))
+            sys.exit(1)
+        except logic.NotFound:
+            print('Organization {} not found'
+                  .format(self.options.organization))
+            sys.exit(1)
+
+        checkpoint = self.options.checkpoint or _get_reindex_checkpoint_path(
+            self.options.since, self.options.organization)
+        done_ids = _read_reindex_checkpoint(checkpoint)
+        if done_ids:
+            print('Resuming from checkpoint {}: {} datasets already indexed'
+                  .format(checkpoint, len(done_ids)))
+        package_ids = [id for id in package_ids if id not in done_ids]
+        total = len(package_ids)
+        print('Reindexing {} datasets with {} workers'
+              .format(total, self.options.workers))
+
+        failed = []
+        with open(checkpoint, 'a') as checkpoint_file:
+            for count, (package_id, error) in enumerate(
+                    self._index_packages(package_ids), start=1):
+                if error:
+                    failed.append(package_id)
+                    print('Error while indexing dataset {}: {}'
+                          .format(package_id, error))
+                else:
+                    checkpoint_file.write(package_id + '\n')
+                    checkpoint_file.flush()
+                if count % 100 == 0 or count == total:
+                    print('{}/{} datasets indexed'.format(count, total))
+
+        # unlike the core rebuild, the index is not cleared beforehand
+        if not self.options.since and not self.options.organization:
+            existing_ids = set(
+                row.id for row in model.Session.query(model.Package.id)
+                .filter(model.Package.state != 'deleted'))
+            deleted_ids.extend(_get_purged_package_ids(existing_ids))
+        _delete_documents(deleted_ids)
+        print('Removed the documents of {} deleted datasets'
+              .format(len(deleted_ids)))
+
+        search.commit()
+
+        if failed:
+            print('{} datasets could not be indexed, run the command again '
+                  'to retry them'.format(len(failed)))
+            sys.exit(1)
+        os.remove(checkpoint)
+        print('Reindex finished')
+
+    def _index_packages(self, package_ids):
+        batch_size = max(self.options.batch_size, 1)
+        batches = [package_ids[i:i + batch_size]
+                   for i in range(0, len(package_ids), batch_size)]
+        if self.options.workers <= 1:
+            for results in itertools.imap(_reindex_packages, batches):
+                for result in results:
+                    yield result
+            return
+        # the forked workers must not share the database connections of
+        # this process, they open their own connections when needed
+        model.Session.remove()
+        model.meta.engine.dispose()
+        pool = multiprocessing.Pool(self.options.workers)
+        try:
+            for results in pool.imap_unordered(_reindex_packages, batches):
+                for result in results:
+                    yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_package_ids_to_reindex(self, state='active'):
+        query = self._get_package_query(state)
+        return [row.id for row in query.order_by(model.Package.id)]
+
+    def _get_package_query(self, state='active'):
+        query = model.Session.query(model.Package.id)\
+            .filter(model.Package.state == state)
+        if self.options.since:
+            since = dateutil.parser.parse(self.options.since)
+            query = query.filter(model.Package.metadata_modified > since)
+        if self.options.organization:
+            organization = model.Group.get(self.options.organization)
+            if not organization or not organization.is_organization:
+                raise logic.NotFound
+            org_ids = [organization.id] + [
+                child[0] for child in
+                organization.get_children_group_hierarchy(
+                    type='organization')]
+            query = query.filter(model.Package.owner_org.in_(org_ids))
+        return query
+
+    def linkcheck(self):
+        """
+        command to check the urls of all resources, to record their
+        headers and to fill in missing sizes and media types
+        """
+        try:
+            resources = self._get_resources_to_check()
+        except (ValueError, OverflowError):
+            print('Invalid timestamp for --since: {}'
+                  .format(self.options.since))
+            sys.exit(1)
+        except logic.NotFound:
+            print('Organization {} not found'
+                  .format(self.options.organization))
+            sys.exit(1)
+
+        urls = set()
+        for resource in resources:
+            urls.update(resource['urls'])
+        total = len(urls)
+        print('Checking {} urls of {} resources with {} threads'
+              .format(total, len(resources), self.options.threads))
+
+        headers_by_url = {}
+        errors = 0
+        results = ogdch_linkcheck.probe_urls(
+            urls, ogdch_helpers.request_content_headers,
+            threads=self.options.threads, per_host=self.options.per_host)
+        for count, (url, headers, error) in enumerate(results, start=1):
+            ogdch_linkcheck.save_result(url, headers, error)
+            if error:
+                errors += 1
+            else:
+                headers_by_url[url] = headers
+            if count % 100 == 0 or count == total:
+                model.Session.commit()
+                print('{}/{} urls checked'.format(count, total))
+        print('{} urls could not be requested'.format(errors))
+
+        if not self.options.dryrun:
+            self._backfill_resources(resources, headers_by_url)
+        print('Linkcheck finished')
+
+    def _get_resources_to_check(self):
+        package_ids = self._get_package_query().subquery()
+        query = model.Session.query(model.Resource)\
+            .filter(model.Resource.package_id.in_(package_ids))\
+            .filter(model.Resource.state == 'active')
+        resources = []
+        for resource in query.yield_per(1000):
+            extras = resource.extras or {}
+            urls = [url for url in (extras.get('download_url'), resource.url)
+                    if url and url.startswith(('http://', 'https://'))]
+            if urls:
+                resources.append({
+                    'id': resource.id,
+                    'package_id': resource.package_id,
+                    'urls': urls,
+                    'download_url': extras.get('download_url'),
+                    'byte_size': extras.get('byte_size'),
+                    'media_type': extras.get('media_type'),
+                })
+        return resources
+
+    def _backfill_resources(self, resources, headers_by_url):
+        backfills = {}
+        for resource in resources:
+            values = _get_backfill_values(resource, headers_by_url)
+            if values:
+                backfills.setdefault(
+                    resource['package_id'], {})[resource['id']] = values
+        print('Filling in size or media type of resources of {} datasets'
+              .format(len(backfills)))
+        for package_id, values_by_resource in backfills.items():
+            try:
+                pkg_dict = logic.get_action('package_show')(
+                    {'ignore_auth': True, 'use_cache': False},
+                    {'id': package_id})
+                for res_dict in pkg_dict['resources']:
+                    res_dict.update(values_by_resource.get(res_dict['id'], {}))
+                logic.get_action('package_update')(
+                    ogdch_helpers.get_site_user_context(ignore_auth=True),
+                    pkg_dict)
+            except Exception as e:
+                model.Session.rollback()
+                print('Error while updating dataset {}: {}'
+                      .format(package_id, e))
+
+
+def _read_reindex_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as checkpoint_file:
+        return set(line.strip() for line in checkpoint_file if line.strip())
+
+
+def _get_reindex_checkpoint_path(since, organization):
+    # runs with different filters must not resume from each other
+    name = 'ogdch_reindex'
+    if since or organization:
+        options = u'{}|{}'.format(since or '', organization or '')
+        name += '-' + hashlib.md5(options.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), name + '.checkpoint')
+
+
+class _DocumentCollector(object):
+    """
+    Stands in for the solr connection of the core package index and
+    keeps the documents instead of sending them
+    """
+    def __init__(self):
+        self.docs = []
+        self.delete_queries = []
+
+    def add(self, docs, **kwargs):
+        self.docs.extend(docs)
+
+    def delete(self, q=None, **kwargs):
+        # the package index deletes the documents of deleted datasets
+        self.delete_queries.append(q)
+
+
+@contextlib.contextmanager
+def _collect_documents(collector):
+    make_connection = search_index.make_connection
+    search_index.make_connection = lambda *args, **kwargs: collector
+    try:
+        yield
+    finally:
+        search_index.make_connection = make_connection
+
+
+def _get_purged_package_ids(package_ids):
+    """
+    Returns the ids of the datasets of this site that are indexed but
+    not in package_ids (e.g. because they have been purged)
+    """
+    conn = make_connection()
+    purged_ids = []
+    start = 0
+    while True:
+        results = conn.search('*:*', **{
+            'fq': '+site_id:"%s" +entity_type:package'
+                  % config.get('ckan.site_id'),
+            'fl': 'id',
+            'sort': 'id asc',
+            'start': start,
+            'rows': 10000,
+        })
+        docs = list(results)
+        if not docs:
+            return purged_ids
+        purged_ids.extend(
+            doc['id'] for doc in docs if doc['id'] not in package_ids)
+        start += len(docs)
+
+
+def _delete_documents(package_ids, chunk_size=500):
+    conn = make_connection()
+    for i in range(0, len(package_ids), chunk_size):
+        ids = ' OR '.join(
+            '"%s"' % id for id in package_ids[i:i + chunk_size])
+        conn.delete(q='+site_id:"%s" +id:(%s)'
+                    % (config.get('ckan.site_id'), ids), commit=False)
+
+
+def _reindex_packages(package_ids):
+    """
+    Builds the search documents of the datasets, prepares them with
+    before_index_batch and sends them to solr with a single request.
+    Returns (package_id, error) for each dataset.
+    """
+    context = {
+        'model': model,
+        'ignore_auth': True,
+        'validate': False,
+        'use_cache': False,
+    }
+    errors = {}
+    collector = _DocumentCollector()
+    package_plugin = plugins.get_plugin('ogdch_pkg')
+    with _collect_documents(collector), \
+            package_plugin.deferred_before_index():
+        for package_id in package_ids:
+            try:
+                pkg_dict = logic.get_action('package_show')(
+                    dict(context), {'id': package_id})
+                search.index_for('Package').index_package(
+                    pkg_dict, defer_commit=True)
+            except Exception as e:
+                model.Session.rollback()
+                errors[package_id] = str(e)
+
+    try:
+        docs = package_plugin.before_index_batch(collector.docs)
+        conn = make_connection()
+        if docs:
+            conn.add(docs, commit=False)
+        for query in collector.delete_queries:
+            conn.delete(q=query, commit=False)
+    except Exception as e:
+        for package_id in package_ids:
+            errors.setdefault(package_id, str(e))
+    return [(package_id, errors.get(package_id))
+            for package_id in package_ids]
+
+
+def _get_backfill_values(resource, headers_by_url):
+    """
+    Returns the missing byte_size and media_type of a resource from the
+    headers of its first url that was requested successfully. The access
+    url is not used if it returns a web page, which is usually a landing
+    page and not the data itself.
+    """
+    for url in resource['urls']:
+        headers = headers_by_url.get(url)
+        if not headers or not 200 <= headers['status_code'] < 300:
+            continue
+        media_type = ogdch_linkcheck.get_media_type(
+            headers.get('content-type'))
+        if url != resource['download_url'] and media_type == 'text/html':
+            continue
+        break
+    else:
+        return {}
+    values = {}
+    content_length = headers.get('content-length') or ''
+    if not resource['byte_size'] and content_length.isdigit():
+        values['byte_size'] = int(content_length)
+    if not resource['media_type'] and media_type:
+        values['media_type'] = media_type
+    return values
@@ -5,16 +5,18 @@ from ckan.plugins import toolkit as tk
 import ckan.model as model
 import ckan.logic as logic
 import ckan.lib.plugins
-from ckan.common import c, config, _, request, OrderedDict
+from ckan.common import c, config, _, request, response, OrderedDict
 import ckan.lib.helpers as h
 import ckan.authz as authz
 import ckan.lib.search as search
 import ckan.lib.base as base
+from ckan.controllers.api import ApiController
 from six import string_types
 
 from ckanext.hierarchy.controller import _children_name_list
 import ckan.controllers.organization as organization
 import ckanext.hierarchy.helpers as hierarchy_helpers
+from ckanext.switzerland import logic as ogdch_logic
 
 import ckan.controllers.group as group
 
@@ -456,11 +458,47 @@ class OgdchPermaController(base.BaseController):
         the corresponding /dataset/{slug} route
         """
         try:
-            dataset = logic.get_action('ogdch_dataset_by_identifier')(
-                {'for_view': True},
+            dataset = logic.get_action('ogdch_dataset_name_by_identifier')(
+                {},
                 {'identifier': id}
             )
             # redirect to dataset detail page
             tk.redirect_to('dataset_read', id=dataset['name'])
         except NotFound:
             abort(404, _('Dataset not found'))
+
+
+class OgdchApiController(ApiController):
+    """
+    This controller serves GET requests to the ogdch_package_show action
+    with ETag and Last-Modified headers. Clients that send the ETag in
+    an If-None-Match header get a 304 response as long as the cached
+    response of the action is still valid.
+    """
+
+    def package_show(self, ver=None):
+        entry = self._get_package_show_cache_entry()
+        if entry and entry['etag'] in request.if_none_match:
+            self._set_package_show_headers(entry)
+            response.status_int = 304
+            return ''
+
+        result = self.action('ogdch_package_show', ver=ver)
+        if response.status_int == 200:
+            entry = self._get_package_show_cache_entry()
+            if entry:
+                self._set_package_show_headers(entry)
+        return result
+
+    def _get_package_show_cache_entry(self):
+        try:
+            lang = ogdch_logic._get_lang(request.params) \
+                if request.params.get('lang') else None
+            return ogdch_logic.get_package_show_cache_entry(
+                request.params.get('id'), lang, model)
+        except ValidationError:
+            return None
+
+    def _set_package_show_headers(self, entry):
+        response.etag = entry['etag']
+        response.last_modified = entry['last_modified']
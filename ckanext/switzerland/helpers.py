@@ -1,30 +1,53 @@
 # coding=UTF-8
 
 import os
+import ckan.plugins as plugins
 import ckan.plugins.toolkit as tk
 import ckan.logic as logic
 from ckan import model as model
 from ckan.exceptions import CkanConfigurationException
 import requests
+import sqlalchemy
+import sqlalchemy.orm
+import hashlib
 import json
+import re
 from ckan.common import _
 from babel import numbers
 import iribaker
 from urlparse import urlparse
 
-from ckan.lib.helpers import lang, url_for, localised_number
+from ckan.lib.helpers import lang, url_for, url_for_static, localised_number
 import ckan.lib.i18n as i18n
 import unicodedata
+import copy
+import ckanext.switzerland.cache as ogdch_cache
+import ckanext.switzerland.linkcheck as ogdch_linkcheck
+from ckanext.showcase.model import ShowcasePackageAssociation
 
 import logging
 log = logging.getLogger(__name__)
 
+__location__ = os.path.realpath(os.path.join(
+    os.getcwd(),
+    os.path.dirname(__file__))
+)
+
 TERMS_OF_USE_OPEN = 'NonCommercialAllowed-CommercialAllowed-ReferenceNotRequired' # noqa
 TERMS_OF_USE_BY = 'NonCommercialAllowed-CommercialAllowed-ReferenceRequired' # noqa
 TERMS_OF_USE_ASK = 'NonCommercialAllowed-CommercialWithPermission-ReferenceNotRequired' # noqa
 TERMS_OF_USE_BY_ASK = 'NonCommercialAllowed-CommercialWithPermission-ReferenceRequired' # noqa
 TERMS_OF_USE_CLOSED = 'ClosedData'
 
+# the terms of use ranked from the most to the least open
+TERMS_OF_USE_RANK = {
+    TERMS_OF_USE_OPEN: 0,
+    TERMS_OF_USE_BY: 1,
+    TERMS_OF_USE_ASK: 2,
+    TERMS_OF_USE_BY_ASK: 3,
+    TERMS_OF_USE_CLOSED: 4,
+}
+
 # these bookmarks can be used in the wordpress page
 # for the terms of use
 mapping_terms_of_use_to_pagemark = {
@@ -43,10 +66,119 @@ showcase_types_mapping = {
     "best_practice": u'{"fr": "Best practice", "de": "Best practice", "en": "Best practice", "it": "Best practice"}', # noqa
 }
 
+# field kinds of the language reduction plans:
+# multilingual fields are parsed and reduced to the requested language,
+# json fields are only parsed and plain fields are left untouched.
+# Fields that are not part of a plan are treated as multilingual.
+FIELD_MULTILINGUAL = 'multilingual'
+FIELD_JSON = 'json'
+FIELD_PLAIN = 'plain'
+
+MULTILINGUAL_PRESETS = [
+    'multilingual_text',
+    'multilingual_output',
+    'multilingual_markdown',
+    'fluent_text',
+    'fluent_markdown',
+    'fluent_tags',
+]
+JSON_PRESETS = [
+    'dicts',
+    'temporals',
+    'languages',
+    'multiple_text',
+    'multiple_select',
+]
+
+# fields set by CKAN core that never contain json
+CORE_PLAIN_FIELDS = [
+    'id', 'name', 'type', 'state', 'owner_org', 'package_id', 'capacity',
+    'creator_user_id', 'revision_id', 'metadata_created', 'metadata_modified',
+    'created', 'last_modified', 'private', 'num_resources', 'num_tags',
+    'license_id', 'license_title', 'license_url', 'version', 'url',
+    'url_type', 'resource_type', 'mimetype', 'mimetype_inner', 'size',
+    'hash', 'position', 'cache_url', 'cache_last_updated',
+    'datastore_active', 'image_url', 'image_display_url', 'is_organization',
+    'approval_status', 'package_count', 'num_followers', 'tracking_summary',
+]
+
+# schema type: (scheming file, key of the field list, additional fields)
+REDUCTION_PLAN_SCHEMAS = {
+    'dataset': ('dcat-ap-switzerland_scheming.json', 'dataset_fields', {
+        # nested dicts are reduced with their own plan
+        'groups': FIELD_PLAIN,
+        'organization': FIELD_PLAIN,
+        'resources': FIELD_PLAIN,
+    }),
+    'resource': ('dcat-ap-switzerland_scheming.json', 'resource_fields', {
+        # the name of a resource is a copy of its title
+        'name': FIELD_MULTILINGUAL,
+    }),
+    'group': ('multilingual_group_scheming.json', 'fields', {}),
+    'organization': ('multilingual_organization_scheming.json', 'fields', {}),
+}
+
+_reduction_plans = None
+
+organization_cache = ogdch_cache.LRUCache('organization', ttl=300)
+site_user_cache = ogdch_cache.LRUCache('site_user', maxsize=1)
+organization_tree_cache = ogdch_cache.LRUCache(
+    'organization_tree', maxsize=10, ttl=3600)
+# sorted and localized lists of groups and trees of organizations
+# by (group type, kind of list, language, version of the groups)
+group_list_cache = ogdch_cache.LRUCache('group_list', maxsize=20, ttl=3600)
+sort_key_cache = ogdch_cache.LRUCache('sort_key', maxsize=10000)
+showcase_types_cache = ogdch_cache.LRUCache('showcase_types', maxsize=1)
+# status code, content-length and content-type by url
+content_headers_cache = ogdch_cache.LRUCache(
+    'content_headers', maxsize=5000, ttl=600)
+# errors of urls that could not be requested, kept shortly so that
+# unreachable hosts do not block a request on every page view
+content_headers_error_cache = ogdch_cache.LRUCache(
+    'content_headers_error', maxsize=5000, ttl=60)
+
+_http_session = None
+
+# whether the showcase_types vocabulary is known to exist in this process
+_showcase_types_created = False
+
+
+def get_site_user():
+    """
+    Returns the site user. It is loaded once per process and only
+    reloaded after the user has been updated.
+    """
+    return site_user_cache.get_or_load(
+        'site_user',
+        lambda: tk.get_action('get_site_user')({'ignore_auth': True}, {}))
+
+
+def get_site_user_context(**kwargs):
+    """
+    Returns a new context for actions performed as site user,
+    extended by the given keyword arguments
+    """
+    context = {'user': get_site_user()['name']}
+    context.update(kwargs)
+    return context
+
+
+def invalidate_site_user(user_id):
+    site_user = site_user_cache.get('site_user')
+    if site_user and user_id in (site_user['id'], site_user['name']):
+        site_user_cache.clear()
+
 
 def get_dataset_count(dataset_type='dataset'):
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
+    """
+    Returns the number of public datasets of a type. The numbers of
+    datasets and showcases are read from the cached ogdch_counts.
+    """
+    if dataset_type == 'dataset':
+        return _get_counts()['total_dataset_count']
+    if dataset_type == 'showcase':
+        return _get_counts()['showcase_count']
+    req_context = get_site_user_context()
     fq = ''.join(['+dataset_type:', dataset_type])
     packages = tk.get_action('package_search')(
         req_context,
@@ -59,17 +191,15 @@ def get_group_count():
     '''
     Return the number of groups
     '''
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
-    groups = tk.get_action('group_list')(req_context, {})
-    return len(groups)
+    return len(_get_counts()['groups'])
 
 
 def get_org_count():
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
-    orgs = tk.get_action('organization_list')(req_context, {})
-    return len(orgs)
+    return _get_counts()['organization_count']
+
+
+def _get_counts():
+    return tk.get_action('ogdch_counts')({}, {})
 
 
 def get_localized_org(org_id=None, include_datasets=False):
@@ -85,6 +215,78 @@ def get_localized_org(org_id=None, include_datasets=False):
         return {}
 
 
+def get_organization_dict(org_id, revision_id=None):
+    '''
+    Returns the organization_show result for an organization. Results are
+    cached per organization id and revision. If the config option
+    ckanext.switzerland.organization_cache_per_request is set, they are
+    only reused within the same request.
+    '''
+    cache_key = (org_id, revision_id)
+    per_request = tk.asbool(tk.config.get(
+        'ckanext.switzerland.organization_cache_per_request', False))
+    memo = ogdch_cache.get_request_memo('organization') if per_request else None  # noqa
+
+    if memo is not None:
+        org_dict = memo.get(cache_key)
+    elif per_request:
+        org_dict = None
+    else:
+        org_dict = organization_cache.get(cache_key)
+
+    if org_dict is None:
+        org_dict = logic.get_action('organization_show')(
+            {},
+            {
+                'id': org_id,
+                'include_users': False,
+                'include_followers': False,
+            }
+        )
+        if memo is not None:
+            memo[cache_key] = org_dict
+        elif not per_request:
+            organization_cache.set(cache_key, org_dict)
+
+    return copy.deepcopy(org_dict)
+
+
+@ogdch_cache.memoize_per_request
+def get_group_version(group_type):
+    '''
+    Returns a version of all groups of a type and of the hierarchy of
+    organizations, which is the same for all processes. It changes when
+    a group is created, changed, moved or deleted (each of these creates
+    a revision).
+    '''
+    groups = model.Session.query(
+        sqlalchemy.func.count(model.Group.id),
+        sqlalchemy.func.max(model.Revision.timestamp)
+    ).outerjoin(
+        model.Revision, model.Revision.id == model.Group.revision_id
+    ).filter(model.Group.type == group_type).one()
+    parents = model.Session.query(
+        sqlalchemy.func.count(model.Member.id),
+        sqlalchemy.func.max(model.Revision.timestamp)
+    ).outerjoin(
+        model.Revision, model.Revision.id == model.Member.revision_id
+    ).filter(
+        model.Member.table_name == 'group',
+        model.Member.capacity == 'parent',
+    ).one()
+    return tuple(groups) + tuple(parents)
+
+
+def invalidate_organization(org_id):
+    organization_cache.invalidate(lambda key: key[0] == org_id)
+    organization_tree_cache.clear()
+    invalidate_group_lists('organization')
+
+
+def invalidate_group_lists(group_type):
+    group_list_cache.invalidate(lambda key: key[0] == group_type)
+
+
 def localize_json_title(facet_item):
     # json.loads tries to convert numbers in Strings to integers. At this point
     # we only need to deal with Strings, so we let them be Strings.
@@ -230,7 +432,30 @@ def simplify_terms_of_use(term_id):
     return 'ClosedData'
 
 
+def get_least_open_terms_of_use(resources):
+    """
+    Returns the terms of use of a dataset, which by definition are
+    the least open rights statement of all its resources
+    """
+    least_open = None
+    for res in resources:
+        if 'rights' not in res:
+            continue
+        rank = TERMS_OF_USE_RANK.get(res['rights'])
+        if rank is None:
+            return TERMS_OF_USE_CLOSED
+        if least_open is None or rank > TERMS_OF_USE_RANK[least_open]:
+            least_open = res['rights']
+    return least_open or TERMS_OF_USE_CLOSED
+
+
 def get_dataset_terms_of_use(pkg):
+    """
+    Returns the terms of use of a dataset given as pkg_dict
+    or as name or id
+    """
+    if isinstance(pkg, dict):
+        return get_least_open_terms_of_use(pkg.get('resources', []))
     rights = logic.get_action('ogdch_dataset_terms_of_use')({}, {'id': pkg})
     return rights['dataset_rights']
 
@@ -245,6 +470,24 @@ def get_dataset_by_identifier(identifier):
         return None
 
 
+def get_related_datasets(see_alsos):
+    """
+    Returns name and localized title of the datasets referenced
+    in see_alsos as a dict by identifier
+    """
+    identifiers = [
+        item.get('dataset_identifier')
+        for item in see_alsos or [] if isinstance(item, dict)
+    ]
+    if not any(identifiers):
+        return {}
+    datasets = logic.get_action('ogdch_datasets_by_identifiers')(
+        {}, {'identifiers': identifiers})
+    for dataset in datasets.values():
+        dataset['title'] = get_localized_value(dataset['title'])
+    return datasets
+
+
 def get_readable_file_size(num, suffix='B'):
     if not num:
         return False
@@ -268,9 +511,151 @@ def parse_json(value, default_value=None):
         return value
 
 
+def get_reduction_plans():
+    '''
+    Returns the reduction plans for datasets, resources, groups and
+    organizations. A plan maps a field name to its field kind and is
+    compiled only once from the scheming files.
+    '''
+    global _reduction_plans
+    if _reduction_plans is None:
+        _reduction_plans = dict(
+            (schema_type, _compile_reduction_plan(*schema))
+            for schema_type, schema in REDUCTION_PLAN_SCHEMAS.iteritems()
+        )
+    return _reduction_plans
+
+
+def _compile_reduction_plan(filename, fields_key, additional_fields):
+    with open(os.path.join(__location__, filename), 'r') as schema_file:
+        schema = json.load(schema_file)
+
+    plan = dict((field, FIELD_PLAIN) for field in CORE_PLAIN_FIELDS)
+    for field in schema.get(fields_key, []):
+        preset = field.get('preset')
+        if preset in MULTILINGUAL_PRESETS:
+            plan[field['field_name']] = FIELD_MULTILINGUAL
+        elif preset in JSON_PRESETS:
+            plan[field['field_name']] = FIELD_JSON
+        else:
+            plan[field['field_name']] = FIELD_PLAIN
+    plan.update(additional_fields)
+    return plan
+
+
+def reduce_fields(data_dict, plan, lang_code=None):
+    '''
+    Parses the json values of a dict in a single pass. If a lang_code is
+    given, multilingual values are replaced by their localized value.
+    '''
+    for key, value in data_dict.iteritems():
+        kind = plan.get(key, FIELD_MULTILINGUAL)
+        if kind == FIELD_PLAIN:
+            continue
+        value = parse_json(value)
+        if (lang_code is not None and kind == FIELD_MULTILINGUAL and
+                isinstance(value, dict)):
+            value = get_localized_value(value, lang_code, default_value='')
+        data_dict[key] = value
+    return data_dict
+
+
+def reduce_package(pkg_dict, lang_code=None, schema_type='dataset'):
+    '''
+    Parses and (if a lang_code is given) localizes a package dict
+    including its groups, organization and resources.
+    '''
+    plans = get_reduction_plans()
+    reduce_fields(pkg_dict, plans[schema_type], lang_code)
+
+    if pkg_dict.get('groups') is not None:
+        try:
+            for group in pkg_dict['groups']:
+                """
+                TODO: somehow the title is messed up here,
+                but the display_name is okay
+                """
+                group['title'] = group['display_name']
+                reduce_fields(group, plans['group'], lang_code)
+        except TypeError:
+            pass
+
+    if isinstance(pkg_dict.get('organization'), dict):
+        reduce_fields(pkg_dict['organization'], plans['organization'],
+                      lang_code)
+
+    if pkg_dict.get('resources') is not None:
+        try:
+            for resource in pkg_dict['resources']:
+                reduce_fields(resource, plans['resource'], lang_code)
+        except TypeError:
+            pass
+
+    return pkg_dict
+
+
+def get_http_session():
+    '''
+    Returns the requests session of the process, which keeps a pool of
+    connections to each host
+    '''
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=20, pool_maxsize=20)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+    return _http_session
+
+
 def get_content_headers(url):
-    response = requests.head(url)
-    return response
+    '''
+    Returns status code, content-length and content-type of the url,
+    or an error if it can not be requested. The results are cached per
+    url. If the url was not requested recently by `paster ogdch
+    linkcheck`, a HEAD request is made.
+    '''
+    headers = content_headers_cache.get(url) or \
+        content_headers_error_cache.get(url)
+    if headers is None:
+        max_age = tk.asint(tk.config.get(
+            'ckanext.switzerland.linkcheck_max_age', 7 * 24 * 3600))
+        headers = ogdch_linkcheck.get_checked_headers(url, max_age)
+        if headers is None:
+            try:
+                headers = request_content_headers(url)
+            except requests.RequestException as e:
+                headers = {'error': str(e)}
+        if 'error' in headers:
+            content_headers_error_cache.set(url, headers)
+        else:
+            content_headers_cache.set(url, headers)
+    return dict(headers)
+
+
+def request_content_headers(url):
+    '''
+    Returns status code, content-length and content-type of a HEAD
+    request to the url. Redirects are not followed, so that the status
+    code of the url itself is returned and the timeouts bound the whole
+    request. Requests that can not connect or read within the configured
+    timeouts raise a requests.Timeout.
+    '''
+    timeout = (
+        float(tk.config.get(
+            'ckanext.switzerland.content_headers_connect_timeout', 3)),
+        float(tk.config.get(
+            'ckanext.switzerland.content_headers_read_timeout', 5)),
+    )
+    response = get_http_session().head(
+        url, timeout=timeout, allow_redirects=False)
+    return {
+        'status_code': response.status_code,
+        'content-length': response.headers.get('content-length', ''),
+        'content-type': response.headers.get('content-type', ''),
+    }
 
 
 def get_piwik_config():
@@ -291,59 +676,78 @@ def ogdch_localised_number(number):
         return localised_number(number)
 
 
-def ogdch_render_tree():
-    '''Returns HTML for a hierarchy of all publishers'''
-    top_nodes = ogdch_group_tree()
-    return _render_tree(top_nodes)
+def ogdch_render_tree(lang_code=None):
+    '''Returns HTML for a hierarchy of all publishers. The HTML is cached
+    per language and version of the organizations, so that it is rendered
+    again when an organization is created, changed, moved or deleted.
+    '''
+    lang_code = lang_code or i18n.get_lang()
+    return organization_tree_cache.get_or_load(
+        (lang_code, get_group_version('organization')),
+        lambda: _render_tree(ogdch_group_tree(lang_code=lang_code), lang_code))
 
 
-def _render_tree(top_nodes):
+def warm_up_organization_tree():
+    '''Renders the hierarchy of all publishers in all languages'''
+    for lang_code in get_langs():
+        ogdch_render_tree(lang_code)
+
+
+def _render_tree(top_nodes, lang_code=None):
     '''Renders a tree of nodes. 10x faster than Jinja/organization_tree.html
     Note: avoids the slow url_for routine.
     '''
-    html = '<ul id="organizations-list">'
+    lang_code = lang_code or i18n.get_lang()
+    html = ['<ul id="organizations-list">']
     for node in top_nodes:
-        html += _render_tree_node(node)
-    return html + '</ul>'
+        _render_tree_node(node, lang_code, html)
+    html.append('</ul>')
+    return ''.join(html)
 
 
-def _render_tree_node(node):
-    html = '<div class="organization-row">'
-    html += '<a href="/%s/organization/%s">%s</a>' % (i18n.get_lang(), node['name'], node['title'])  # noqa
-    html += '</div>'
+def _render_tree_node(node, lang_code, html):
+    html.append('<li id="node_%s" class="organization">' % node['name'])
+    html.append('<div class="organization-row">')
+    html.append('<a href="/%s/organization/%s">%s</a>' % (lang_code, node['name'], node['title']))  # noqa
+    html.append('</div>')
     if node['children']:
-        html += '<ul>'
+        html.append('<ul>')
         for child in node['children']:
-            html += _render_tree_node(child)
-        html += '</ul>'
-    html = '<li id="node_%s" class="organization">%s</li>' % (node['name'], html)  # noqa
-    return html
+            _render_tree_node(child, lang_code, html)
+        html.append('</ul>')
+    html.append('</li>')
 
 
-def ogdch_group_tree(type_='organization'):
-    organizations = tk.get_action('group_tree')(
-        {},
-        {'type': type_, 'all_fields': True}
-    )
-    organizations = get_sorted_orgs_by_translated_title(organizations)
-    return organizations
+def ogdch_group_tree(type_='organization', lang_code=None):
+    lang_code = lang_code or i18n.get_lang()
+
+    def load_group_tree():
+        organizations = tk.get_action('group_tree')(
+            {},
+            {'type': type_, 'all_fields': True}
+        )
+        return get_sorted_orgs_by_translated_title(organizations, lang_code)
+
+    return copy.deepcopy(group_list_cache.get_or_load(
+        (type_, 'tree', lang_code, get_group_version(type_)),
+        load_group_tree))
 
 
-def get_sorted_orgs_by_translated_title(organizations):
+def get_sorted_orgs_by_translated_title(organizations, lang_code=None):
     for organization in organizations:
-        organization['title'] = get_translated_group_title(organization['title'])  # noqa
+        organization['title'] = get_translated_group_title(organization['title'], lang_code)  # noqa
         if organization['children']:
-            organization['children'] = get_sorted_orgs_by_translated_title(organization['children'])  # noqa
+            organization['children'] = get_sorted_orgs_by_translated_title(organization['children'], lang_code)  # noqa
 
-    organizations.sort(key=lambda org: strip_accents(org['title'].lower()), reverse=False)  # noqa
+    organizations.sort(key=lambda org: get_sort_key(org['title']))
     return organizations
 
 
-def get_translated_group_title(titles_string):
+def get_translated_group_title(titles_string, lang_code=None):
     group_titles_dict = parse_json(titles_string)
     return get_localized_value(
         group_titles_dict,
-        i18n.get_lang(),
+        lang_code or i18n.get_lang(),
         titles_string
     )
 
@@ -355,14 +759,55 @@ def strip_accents(s):
    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')  # noqa
 
 
+def get_sort_key(title):
+    '''
+    Returns the key to sort a localized title by. The keys are cached,
+    as the unicode normalization is expensive for long lists.
+    '''
+    sort_key = sort_key_cache.get(title)
+    if sort_key is None:
+        sort_key = strip_accents(title.lower())
+        sort_key_cache.set(title, sort_key)
+    return sort_key
+
+
+def normalize_format(resource_format):
+    return resource_format.strip().lower()
+
+
+def build_format_index(format_mapping):
+    '''
+    Inverts the format mapping of the mapping.yaml into a dict from
+    normalized alias to format. Aliases are also added without their
+    mime type prefix (e.g. 'tab-separated-values') and, if they could be
+    a file extension, with a leading dot (e.g. '.csv'). These derived
+    aliases never replace an alias listed in the mapping.
+    '''
+    aliases = [
+        (normalize_format(alias), key)
+        for key, values in format_mapping.iteritems()
+        for alias in values
+    ]
+    format_index = {}
+    for alias, key in aliases:
+        format_index.setdefault(alias, key)
+    for alias, key in aliases:
+        format_index.setdefault(alias.split('/')[-1], key)
+        if re.match(r'^[^\s./]+$', alias):
+            format_index.setdefault('.' + alias, key)
+    return format_index
+
+
 # all formats that need to be mapped have to be entered in the mapping.yaml
-def map_to_valid_format(resource_format, format_mapping):
-    resource_format_lower = resource_format.lower()
-    for key, values in format_mapping.iteritems():
-        if resource_format_lower in values:
-            return key
-    else:
+def map_to_valid_format(resource_format, format_index):
+    if not resource_format:
         return None
+    resource_format = normalize_format(resource_format)
+    mapped_format = format_index.get(resource_format)
+    if mapped_format is None:
+        # strip mime type prefixes like 'text/'
+        mapped_format = format_index.get(resource_format.split('/')[-1])
+    return mapped_format
 
 
 # convert URI to IRI (used for RDF)
@@ -436,20 +881,126 @@ def get_shacl_result_file_path(resultdir, shapefile, format):
     return filepath
 
 
-def get_showcases_for_dataset(id):
+def showcases_enabled():
     '''
-    Return a list of showcases a dataset is associated with
+    Returns whether a showcase plugin is loaded, which maps and creates
+    the table of the showcase associations
     '''
-    context = {'model': model, 'session': model.Session,
-               'user': tk.c.user or tk.c.author, 'for_view': True,
-               'auth_user_obj': tk.c.userobj}
-    data_dict = {'package_id': id}
+    return plugins.plugin_loaded('ogdch_showcase') or \
+        plugins.plugin_loaded('showcase')
 
+
+def get_showcases_for_dataset(id, from_index=True):
+    '''
+    Return a list of showcases a dataset is associated with. The showcases
+    are read from the search index, only if the dataset is not indexed yet
+    (or from_index is False) they are loaded from the database.
+    '''
+    if not showcases_enabled():
+        return []
     try:
-        return tk.get_action('ckanext_package_showcase_list')(
-            context, data_dict)
-    except logic.NotFound:
-        return None
+        if not from_index:
+            raise KeyError
+        result = tk.get_action('package_search')(get_site_user_context(), {
+            'fq': '+(id:"{0}" OR name:"{0}")'.format(id.replace('"', '')),
+            'fl': 'showcases',
+            'rows': 1,
+            'include_private': True,
+        })
+        showcases = json.loads(result['results'][0]['showcases'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        pkg = model.Package.get(id)
+        if pkg is None:
+            return None
+        showcases = load_showcases_for_dataset(pkg.id)
+
+    num_datasets = _get_showcase_dataset_counts(
+        [showcase['id'] for showcase in showcases])
+    for showcase in showcases:
+        showcase['num_datasets'] = num_datasets.get(showcase['id'], 0)
+        showcase['image_display_url'] = _get_showcase_image_display_url(
+            showcase.get('image_url'))
+    return showcases
+
+
+def load_showcases_for_dataset(package_id):
+    '''
+    Loads the active, public showcases of a dataset from the database,
+    with the fields that are needed to list them. They are stored in the
+    public search document, so private showcases are left out.
+    '''
+    if not showcases_enabled():
+        return []
+    showcases = model.Session.query(model.Package).join(
+        ShowcasePackageAssociation,
+        ShowcasePackageAssociation.showcase_id == model.Package.id
+    ).filter(
+        ShowcasePackageAssociation.package_id == package_id,
+        model.Package.state == 'active',
+        model.Package.private == False,  # noqa
+    ).order_by(model.Package.title)
+    return [{
+        'id': showcase.id,
+        'name': showcase.name,
+        'title': showcase.title,
+        'notes': showcase.notes,
+        'url': showcase.url,
+        'image_url': showcase.extras.get('image_url'),
+        'showcase_type': showcase.extras.get('showcase_type'),
+    } for showcase in showcases]
+
+
+def get_showcases_version(package_id):
+    '''
+    Returns a hash of the showcases of a dataset, their last modification
+    and their number of datasets, which changes whenever the showcases
+    shown with the dataset change. Without a showcase plugin it is
+    always the same.
+    '''
+    if not showcases_enabled():
+        return ''
+    other_association = sqlalchemy.orm.aliased(ShowcasePackageAssociation)
+    rows = model.Session.query(
+        ShowcasePackageAssociation.showcase_id,
+        model.Package.metadata_modified,
+        sqlalchemy.func.count(other_association.package_id)
+    ).join(
+        model.Package,
+        ShowcasePackageAssociation.showcase_id == model.Package.id
+    ).outerjoin(
+        other_association,
+        other_association.showcase_id == ShowcasePackageAssociation.showcase_id  # noqa
+    ).filter(
+        ShowcasePackageAssociation.package_id == package_id,
+    ).group_by(
+        ShowcasePackageAssociation.showcase_id,
+        model.Package.metadata_modified,
+    ).order_by(ShowcasePackageAssociation.showcase_id)
+    return hashlib.md5(repr(
+        [(row[0], str(row[1]), row[2]) for row in rows]
+    )).hexdigest()
+
+
+def _get_showcase_dataset_counts(showcase_ids):
+    if not showcase_ids:
+        return {}
+    rows = model.Session.query(
+        ShowcasePackageAssociation.showcase_id,
+        sqlalchemy.func.count(ShowcasePackageAssociation.package_id)
+    ).join(
+        model.Package,
+        ShowcasePackageAssociation.package_id == model.Package.id
+    ).filter(
+        ShowcasePackageAssociation.showcase_id.in_(showcase_ids),
+        model.Package.state == 'active',
+    ).group_by(ShowcasePackageAssociation.showcase_id)
+    return dict(rows)
+
+
+def _get_showcase_image_display_url(image_url):
+    if not image_url or image_url.startswith('http'):
+        return image_url
+    return url_for_static('uploads/showcase/%s' % image_url, qualified=True)
 
 
 def get_localized_newsletter_url():
@@ -467,8 +1018,8 @@ def create_showcase_types():
     """
     Create tags and vocabulary for showcase types, if they don't exist already.
     """
-    user = tk.get_action("get_site_user")({"ignore_auth": True}, ())
-    context = {"user": user["name"]}
+    global _showcase_types_created
+    context = get_site_user_context()
     try:
         data = {"id": "showcase_types"}
         tk.get_action("vocabulary_show")(context, data)
@@ -501,22 +1052,35 @@ def create_showcase_types():
             log.info("Adding tag {0} to vocab 'showcase_types'".format(tag))
             data = {"name": tag, "vocabulary_id": vocab["id"]}
             tk.get_action("tag_create")(context, data)
+    _showcase_types_created = True
 
 
 def showcase_types():
     """
     Return the list of showcase types from the showcase_types vocabulary.
+    The vocabulary is only checked once per process and the list is cached
+    until the tags of a vocabulary change.
     """
-    create_showcase_types()
+    if not _showcase_types_created:
+        create_showcase_types()
     try:
-        showcase_types = tk.get_action("tag_list")(
-            data_dict={"vocabulary_id": "showcase_types"}
+        return showcase_types_cache.get_or_load(
+            'showcase_types',
+            lambda: tk.get_action("tag_list")(
+                data_dict={"vocabulary_id": "showcase_types"}
+            )
         )
-        return showcase_types
     except tk.ObjectNotFound:
         return None
 
 
+def invalidate_showcase_types(vocabulary_deleted=False):
+    global _showcase_types_created
+    showcase_types_cache.clear()
+    if vocabulary_deleted:
+        _showcase_types_created = False
+
+
 def get_showcase_type_name(showcase_type):
     type_string = showcase_types_mapping.get(showcase_type, showcase_type)
     return get_localized_value(parse_json(type_string))
@@ -529,21 +1093,28 @@ def group_name_in_groups(group_name, groups):
     return False
 
 
-def get_localized_group_list():
+def get_localized_group_list(lang_code=None):
     """
     Returns a list of dicts containing the id, name and localized title
-    for each group.
+    for each group, sorted by the title. The lists are cached per language
+    and version of the groups.
     """
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
-    groups = tk.get_action('group_list')(req_context, {'all_fields': True})
-    group_list = []
-    for group in groups:
-        group_list.append({
-            'id': group['id'],
-            'name': group['name'],
-            'title': get_localized_value(group['title'], i18n.get_lang()),
-        })
-
-    group_list.sort(key=lambda group: strip_accents(group['title'].lower()), reverse=False)  # noqa
-    return group_list
+    lang_code = lang_code or i18n.get_lang()
+
+    def load_group_list():
+        req_context = get_site_user_context()
+        groups = tk.get_action('group_list')(
+            req_context, {'all_fields': True})
+        group_list = []
+        for group in groups:
+            group_list.append({
+                'id': group['id'],
+                'name': group['name'],
+                'title': get_localized_value(group['title'], lang_code),
+            })
+        group_list.sort(key=lambda group: get_sort_key(group['title']))
+        return group_list
+
+    return copy.deepcopy(group_list_cache.get_or_load(
+        ('group', 'list', lang_code, get_group_version('group')),
+        load_group_list))
@@ -0,0 +1,133 @@
+# coding=UTF-8
+
+import datetime
+import itertools
+import threading
+import urlparse
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from sqlalchemy import Table, Column, types
+from ckan import model
+from ckan.model import meta
+
+import logging
+log = logging.getLogger(__name__)
+
+# the results of `paster ogdch linkcheck` by url
+linkcheck_table = Table(
+    'ogdch_linkcheck', meta.metadata,
+    Column('url', types.UnicodeText, primary_key=True),
+    Column('status_code', types.Integer),
+    Column('content_length', types.UnicodeText),
+    Column('content_type', types.UnicodeText),
+    Column('error', types.UnicodeText),
+    Column('checked', types.DateTime, nullable=False),
+)
+
+
+def setup():
+    """
+    Creates the table of the link check results if it does not exist
+    """
+    if not linkcheck_table.exists(bind=meta.engine):
+        linkcheck_table.create(bind=meta.engine)
+        log.info('Created table %s' % linkcheck_table.name)
+
+
+def get_checked_headers(url, max_age):
+    """
+    Returns status code, content-length and content-type of the url as
+    recorded by the last link check, or the error if it could not be
+    requested. Returns None if the url was not checked within the last
+    `max_age` seconds.
+    """
+    checked_after = datetime.datetime.utcnow() - \
+        datetime.timedelta(seconds=max_age)
+    row = model.Session.execute(
+        linkcheck_table.select().where(
+            (linkcheck_table.c.url == url) &
+            (linkcheck_table.c.checked > checked_after))
+    ).first()
+    if row is None:
+        return None
+    if row.error is not None:
+        return {'error': row.error}
+    return {
+        'status_code': row.status_code,
+        'content-length': row.content_length or '',
+        'content-type': row.content_type or '',
+    }
+
+
+def save_result(url, headers=None, error=None):
+    """
+    Records the headers of the url or the error that occurred when it was
+    requested. The caller has to commit the session.
+    """
+    headers = headers or {}
+    model.Session.execute(
+        linkcheck_table.delete().where(linkcheck_table.c.url == url))
+    model.Session.execute(linkcheck_table.insert().values(
+        url=url,
+        status_code=headers.get('status_code'),
+        content_length=headers.get('content-length'),
+        content_type=headers.get('content-type'),
+        error=error,
+        checked=datetime.datetime.utcnow(),
+    ))
+
+
+def probe_urls(urls, request, threads=50, per_host=4):
+    """
+    Calls request(url) for all urls with a pool of threads, but with
+    at most `per_host` concurrent requests to the same host. Yields
+    (url, headers, error) in the order the requests finish.
+    """
+    semaphores = {}
+    lock = threading.Lock()
+
+    def probe(url):
+        host = _get_host(url)
+        with lock:
+            semaphore = semaphores.setdefault(
+                host, threading.BoundedSemaphore(per_host))
+        with semaphore:
+            try:
+                return url, request(url), None
+            except Exception as e:
+                return url, None, str(e) or e.__class__.__name__
+
+    pool = ThreadPool(threads)
+    try:
+        for result in pool.imap_unordered(probe, interleave_by_host(urls)):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def interleave_by_host(urls):
+    """
+    Orders the urls so that urls of the same host are spread out, which
+    keeps threads from waiting for the same host while others are idle
+    """
+    by_host = OrderedDict()
+    for url in urls:
+        by_host.setdefault(_get_host(url), []).append(url)
+    return [
+        url for urls_of_round in itertools.izip_longest(*by_host.values())
+        for url in urls_of_round if url is not None
+    ]
+
+
+def get_media_type(content_type):
+    """
+    Returns the media type of a content-type header without parameters,
+    e.g. 'text/csv' for 'text/csv; charset=utf-8'
+    """
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def _get_host(url):
+    return urlparse.urlparse(url).netloc.lower()
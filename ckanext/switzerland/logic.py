@@ -3,20 +3,30 @@ import itertools
 import json
 import re
 import csv
+import copy
+import functools
+import hashlib
 import subprocess
 import rdflib
 from unidecode import unidecode
 from collections import OrderedDict
-from ckan.plugins.toolkit import get_or_bust, side_effect_free
-from ckan.logic import ActionError, NotFound, ValidationError
+from multiprocessing.pool import ThreadPool
+from ckan.plugins.toolkit import get_or_bust, side_effect_free, chained_action
+from ckan.logic import ActionError, NotFound, NotAuthorized, ValidationError
+import ckan.authz as authz
+from ckanext.showcase.model import ShowcasePackageAssociation
 from ckan.exceptions import CkanConfigurationException
 import ckan.plugins.toolkit as tk
+import ckan.lib.search as search
+import ckan.lib.datapreview as datapreview
 from ckan.lib.search.common import make_connection
 from ckanext.harvest.model import HarvestSource, HarvestJob, HarvestObject
 from ckanext.dcat.processors import RDFParserException
 from ckanext.switzerland.dcat.shaclprocessor import (
     ShaclParser, SHACLParserException)
 import helpers as ogdch_helpers
+import cache as ogdch_cache
+import suggest as ogdch_suggest
 
 import logging
 log = logging.getLogger(__name__)
@@ -25,6 +35,17 @@ FORMAT_TURTLE = 'ttl'
 DATA_IDENTIFIER = 'data'
 RESULT_IDENTIFIER = 'result'
 
+# responses of ogdch_package_show by dataset id, version and language
+package_show_cache = ogdch_cache.LRUCache('package_show', ttl=600)
+# result of ogdch_counts
+counts_cache = ogdch_cache.LRUCache('counts', maxsize=1, ttl=60)
+# id and name of datasets by identifier
+identifier_cache = ogdch_cache.LRUCache('identifier', maxsize=10000, ttl=300)
+# highlighted suggestions by (q, lang, fq)
+autosuggest_cache = ogdch_cache.LRUCache('autosuggest', maxsize=5000, ttl=300)
+
+_suggest_connection = None
+
 
 @side_effect_free
 def ogdch_counts(context, data_dict):
@@ -34,69 +55,253 @@ def ogdch_counts(context, data_dict):
     - number of datasets per group
     - total number of showcases
     - total number of organisations (including all levels of the hierarchy)
+
+    The counts are cached for a short time (see counts_cache_ttl). Counts
+    older than ckanext.switzerland.counts_cache_refresh seconds are
+    reloaded in the background.
     '''
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
+    model = context['model']
+    refresh_after = tk.asint(
+        tk.config.get('ckanext.switzerland.counts_cache_refresh', 30))
+    counts = counts_cache.get_or_load(
+        'counts', lambda: _load_counts(model), refresh_after)
+    return copy.deepcopy(counts)
+
+
+def invalidate_counts_cache():
+    counts_cache.clear()
+
+
+def _load_counts(model):
+    facets = _get_count_facets()
+    organization_count = model.Session.query(model.Group).filter(
+        model.Group.is_organization == True,  # noqa
+        model.Group.type == 'organization',
+        model.Group.state == 'active',
+    ).count()
+    group_names = model.Session.query(model.Group.name).filter(
+        model.Group.is_organization == False,  # noqa
+        model.Group.type == 'group',
+        model.Group.state == 'active',
+    ).order_by(model.Group.title)
+    group_names = [row.name for row in group_names]
 
-    # group_list contains the number of datasets in the 'packages' field
-    groups = tk.get_action('group_list')(req_context, {'all_fields': True})
     group_count = OrderedDict()
-    for group in groups:
-        group_count[group['name']] = group['package_count']
+    for name in group_names:
+        group_count[name] = facets['groups'].get(name, 0)
 
     return {
-        'total_dataset_count': ogdch_helpers.get_dataset_count('dataset'), # noqa
-        'showcase_count': ogdch_helpers.get_dataset_count('showcase'), # noqa
+        'total_dataset_count': facets['dataset_type'].get('dataset', 0),
+        'showcase_count': facets['dataset_type'].get('showcase', 0),
         'groups': group_count,
-        'organization_count': ogdch_helpers.get_org_count(),
+        'organization_count': organization_count,
     }
 
 
-@side_effect_free  # noqa
-def ogdch_package_show(context, data_dict):  # noqa
+def _get_count_facets():
+    '''
+    Returns the number of public datasets per dataset type and the number
+    of datasets per group (including private ones, like group_list) from
+    a single Solr request
+    '''
+    solr = make_connection()
+    try:
+        results = solr.search('*:*', **{
+            'fq': [
+                '+site_id:"%s"' % tk.config.get('ckan.site_id'),
+                '+state:active',
+                '{!tag=capacity}+capacity:public',
+            ],
+            'rows': 0,
+            'facet': 'true',
+            'facet.field': ['dataset_type', '{!ex=capacity}groups'],
+            'facet.limit': -1,
+            'facet.mincount': 1,
+        })
+    except pysolr.SolrError as e:
+        log.exception('Could not load counts from solr: %s' % e)
+        raise ActionError('Error retrieving counts from solr')
+
+    facets = {}
+    for field, values in results.facets['facet_fields'].items():
+        facets[field] = dict(zip(values[::2], values[1::2]))
+    return facets
+
+
+def _get_lang(data_dict, field='lang'):
+    '''
+    Returns the two-letter language code requested in data_dict
+    '''
+    lang = get_or_bust(data_dict, field)
+
+    # parse language from values like de_CH
+    if len(lang) > 2:
+        lang = lang[:2]
+
+    if lang not in ['en', 'it', 'de', 'fr']:
+        raise ValidationError('%s must be one of [en, it, de, fr]' % field)
+    return lang
+
+
+@side_effect_free
+def ogdch_package_show(context, data_dict):
     """
     custom package_show logic that returns a dataset together
     with related datasets, showcases and terms of use
+
+    If the optional parameter 'lang' is given (one of en, de, fr, it),
+    all multilingual values are reduced to this language.
+
+    The responses are cached per dataset version and language.
     """
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    context.update({'user': user['name'], 'for_view': True})
     id = get_or_bust(data_dict, 'id')
+    lang = _get_lang(data_dict) if data_dict.get('lang') else None
+
+    entry = get_package_show_cache_entry(id, lang, context['model'])
+    if entry is None:
+        pkg = context['model'].Package.get(id)
+        if pkg is None:
+            raise NotFound
+        key = _package_show_cache_key(pkg, lang)
+        result = _ogdch_package_show(context, id, lang)
+        entry = {
+            'result': result,
+            'etag': hashlib.md5(
+                json.dumps(result, sort_keys=True, default=str)
+            ).hexdigest(),
+            'last_modified': pkg.metadata_modified,
+        }
+        package_show_cache.set(key, entry)
+    return copy.deepcopy(entry['result'])
+
+
+def get_package_show_cache_entry(id, lang, model):
+    '''
+    Returns the cached response of ogdch_package_show as dict with the
+    keys result, etag and last_modified, or None if it is not cached
+    '''
+    pkg = model.Package.get(id)
+    if pkg is None:
+        return None
+    return package_show_cache.get(_package_show_cache_key(pkg, lang))
+
+
+def invalidate_package_show_cache(id, model):
+    '''
+    Removes all cached responses of ogdch_package_show for a dataset
+    '''
+    pkg = model.Package.get(id)
+    pkg_id = pkg.id if pkg else id
+    package_show_cache.invalidate(lambda key: key[0] == pkg_id)
+
+
+def _package_show_cache_key(pkg, lang):
+    # the associations of showcases do not change the dataset, so a hash
+    # of the showcases is part of the key for all processes to notice
+    return (pkg.id, pkg.metadata_modified,
+            ogdch_helpers.get_showcases_version(pkg.id), lang)
+
+
+def _ogdch_package_show(context, id, lang):
+    context.update(ogdch_helpers.get_site_user_context(for_view=True))
 
     result = tk.get_action('package_show')(context, {'id': id})
     if result:
         if result.get('see_alsos'):
-            for item in result.get('see_alsos'):
-                try:
-                    related_dataset = tk.get_action('ogdch_dataset_by_identifier')(  # noqa
-                        context, {'identifier': item.get('dataset_identifier')})  # noqa
-                    if related_dataset:
-                        item['title'] = related_dataset['title']
-                        item['name'] = related_dataset['name']
-                except:
-                    continue
+            _add_related_datasets(context, result['see_alsos'])
 
         try:
-            showcases = ogdch_helpers.get_showcases_for_dataset(id=id)
+            # loaded from the database to match the cache key
+            showcases = ogdch_helpers.get_showcases_for_dataset(
+                id=id, from_index=False)
             result['showcases'] = showcases
         except:
             pass
 
-        try:
-            result['terms_of_use'] = tk.get_action('ogdch_dataset_terms_of_use')(  # noqa
-                context, {'id': id})
-        except:
-            raise "Terms of Use could not be found for dataset {}".format(id)
+        result['terms_of_use'] = {
+            'dataset_rights': ogdch_helpers.get_least_open_terms_of_use(
+                result['resources'])
+        }
 
+        resource_ids_with_views = _get_resource_ids_with_views(
+            context['model'], [r['id'] for r in result['resources']])
         for resource in result['resources']:
-            resource_views = tk.get_action('resource_view_list')(
-                context, {'id': resource['id']})
-            resource['has_views'] = len(resource_views) > 0
+            resource['has_views'] = resource['id'] in resource_ids_with_views
+
+        if lang:
+            result = _reduce_package_show_result(result, lang)
 
         return result
     else:
         raise NotFound
 
 
+def _add_related_datasets(context, see_alsos):
+    '''
+    Adds title and name of the related datasets to the see_alsos. If
+    they can not be loaded, the see_alsos are left as they are.
+    '''
+    identifiers = [
+        item.get('dataset_identifier')
+        for item in see_alsos if isinstance(item, dict)
+    ]
+    try:
+        related_datasets = tk.get_action('ogdch_datasets_by_identifiers')(
+            context, {'identifiers': identifiers})
+    except Exception as e:
+        log.warning('Could not load related datasets: %s' % e)
+        return
+    for item in see_alsos:
+        if not isinstance(item, dict):
+            continue
+        related_dataset = related_datasets.get(item.get('dataset_identifier'))
+        if related_dataset:
+            item['title'] = related_dataset['title']
+            item['name'] = related_dataset['name']
+
+
+@chained_action
+@side_effect_free
+def package_show(up_func, context, data_dict):
+    '''
+    package_show that reduces all multilingual values to the language
+    given in the optional parameter 'lang' (one of en, de, fr, it).
+    Without this parameter the result of package_show is not changed.
+    '''
+    lang = _get_lang(data_dict) if data_dict.get('lang') else None
+    result = up_func(context, data_dict)
+    if lang:
+        result = ogdch_helpers.reduce_package(result, lang)
+    return result
+
+
+def _get_resource_ids_with_views(model, resource_ids):
+    '''
+    Returns the ids of those resources that have at least one view
+    of an enabled view plugin (like resource_view_list)
+    '''
+    if not resource_ids:
+        return set()
+    rows = model.Session.query(model.ResourceView.resource_id,
+                               model.ResourceView.view_type)\
+        .filter(model.ResourceView.resource_id.in_(resource_ids))\
+        .distinct()
+    return set(row.resource_id for row in rows
+               if datapreview.get_view_plugin(row.view_type))
+
+
+def _reduce_package_show_result(result, lang):
+    result = ogdch_helpers.reduce_package(result, lang)
+    for item in result.get('see_alsos') or []:
+        if isinstance(item, dict) and 'title' in item:
+            item['title'] = ogdch_helpers.get_localized_value(
+                item['title'], lang)
+    dataset_plan = ogdch_helpers.get_reduction_plans()['dataset']
+    for showcase in result.get('showcases') or []:
+        ogdch_helpers.reduce_fields(showcase, dataset_plan, lang)
+    return result
+
+
 @side_effect_free
 def ogdch_showcase_search(context, data_dict):
     '''
@@ -104,8 +309,7 @@ def ogdch_showcase_search(context, data_dict):
     so that the ckanext-showcase before_view method is called. This includes
     the number of datasets in each showcase in the output.
     '''
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    context.update({'user': user['name'], 'for_view': True})
+    context.update(ogdch_helpers.get_site_user_context(for_view=True))
 
     if data_dict['fq']:
         data_dict['fq'] += ' dataset_type:showcase'
@@ -122,15 +326,54 @@ def ogdch_showcase_search(context, data_dict):
 @side_effect_free
 def ogdch_content_headers(context, data_dict):
     '''
-    Returns some headers of a remote resource
+    Returns some headers of a remote resource, or an error if it can
+    not be requested
     '''
     url = get_or_bust(data_dict, 'url')
-    response = ogdch_helpers.get_content_headers(url)
-    return {
-        'status_code': response.status_code,
-        'content-length': response.headers.get('content-length', ''),
-        'content-type': response.headers.get('content-type', ''),
-    }
+    return ogdch_helpers.get_content_headers(url)
+
+
+@side_effect_free
+def ogdch_content_headers_batch(context, data_dict):
+    '''
+    Returns some headers of many remote resources as a dict by url.
+    The urls (a list or a whitespace-separated string) are requested
+    concurrently by a bounded number of threads. If a resource can not
+    be requested, its entry contains an error instead of the headers.
+    '''
+    urls = get_or_bust(data_dict, 'urls')
+    if isinstance(urls, basestring):
+        urls = urls.split()
+    urls = list(OrderedDict.fromkeys(url for url in urls if url))
+    max_urls = tk.asint(tk.config.get(
+        'ckanext.switzerland.content_headers_batch_max_urls', 100))
+    if len(urls) > max_urls:
+        raise ValidationError(
+            'urls must not contain more than %s urls' % max_urls)
+    if not urls:
+        return {}
+
+    max_threads = tk.asint(tk.config.get(
+        'ckanext.switzerland.content_headers_batch_threads', 10))
+    pool = ThreadPool(min(len(urls), max_threads))
+    try:
+        results = pool.map(
+            functools.partial(_get_content_headers_in_thread,
+                              context['model']),
+            urls)
+    finally:
+        pool.close()
+        pool.join()
+    return OrderedDict(zip(urls, results))
+
+
+def _get_content_headers_in_thread(model, url):
+    try:
+        return ogdch_helpers.get_content_headers(url)
+    finally:
+        # the results of the link check are read with the scoped
+        # session of the pool thread
+        model.Session.remove()
 
 
 @side_effect_free
@@ -140,44 +383,34 @@ def ogdch_dataset_terms_of_use(context, data_dict):
 
     By definition the terms of use of a dataset corresponds
     to the least open rights statement of all distributions of
-    the dataset
-    '''
-    terms = [
-        'NonCommercialAllowed-CommercialAllowed-ReferenceNotRequired',
-        'NonCommercialAllowed-CommercialAllowed-ReferenceRequired',
-        'NonCommercialAllowed-CommercialWithPermission-ReferenceNotRequired',
-        'NonCommercialAllowed-CommercialWithPermission-ReferenceRequired',
-        'ClosedData',
-    ]
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    req_context = {'user': user['name']}
+    the dataset. It is computed when the dataset is indexed and read
+    from the search index, the dataset is only loaded if the index
+    does not contain it yet.
+    '''
+    req_context = ogdch_helpers.get_site_user_context()
     pkg_id = get_or_bust(data_dict, 'id')
-    pkg = tk.get_action('package_show')(req_context, {'id': pkg_id})
 
-    least_open = None
-    for res in pkg['resources']:
-        if 'rights' in res:
-            if res['rights'] not in terms:
-                least_open = 'ClosedData'
-                break
-            if least_open is None:
-                least_open = res['rights']
-                continue
-            if terms.index(res['rights']) > terms.index(least_open):
-                least_open = res['rights']
-
-    if least_open is None:
-        least_open = 'ClosedData'
+    result = tk.get_action('package_search')(req_context, {
+        'fq': '+(id:"{0}" OR name:"{0}")'.format(pkg_id.replace('"', '')),
+        'fl': 'dataset_rights',
+        'rows': 1,
+        'include_private': True,
+    })
+    if result['results'] and result['results'][0].get('dataset_rights'):
+        return {
+            'dataset_rights': result['results'][0]['dataset_rights']
+        }
 
+    pkg = tk.get_action('package_show')(req_context, {'id': pkg_id})
     return {
-        'dataset_rights': least_open
+        'dataset_rights': ogdch_helpers.get_least_open_terms_of_use(
+            pkg['resources'])
     }
 
 
 @side_effect_free
 def ogdch_dataset_by_identifier(context, data_dict):
-    user = tk.get_action('get_site_user')({'ignore_auth': True}, {})
-    context.update({'user': user['name']})
+    context.update(ogdch_helpers.get_site_user_context())
     identifier = get_or_bust(data_dict, 'identifier')
 
     param = 'identifier:%s' % identifier
@@ -188,10 +421,98 @@ def ogdch_dataset_by_identifier(context, data_dict):
         raise NotFound
 
 
+@side_effect_free
+def ogdch_dataset_name_by_identifier(context, data_dict):
+    '''
+    Returns only id and name of the dataset with the given identifier.
+    The result is cached unless the context contains 'use_cache': False.
+    '''
+    identifier = get_or_bust(data_dict, 'identifier')
+    if not identifier:
+        raise NotFound
+    use_cache = context.get('use_cache', True)
+    if use_cache:
+        dataset = identifier_cache.get(identifier)
+        if dataset is not None:
+            return dict(dataset)
+
+    context.update(ogdch_helpers.get_site_user_context())
+    result = tk.get_action('package_search')(context, {
+        'fq': 'identifier:%s' % _quote_solr_value(identifier),
+        'fl': 'id,name',
+        'rows': 1,
+    })
+    try:
+        dataset = {
+            'id': result['results'][0]['id'],
+            'name': result['results'][0]['name'],
+        }
+    except (KeyError, IndexError, TypeError):
+        raise NotFound
+
+    if use_cache:
+        identifier_cache.set(identifier, dataset)
+    return dict(dataset)
+
+
+def invalidate_identifier_cache(pkg_dict):
+    '''
+    Removes the cached lookups of the identifier of a dataset
+    and all cached lookups that resolve to the dataset
+    '''
+    if pkg_dict.get('identifier'):
+        identifier_cache.pop(pkg_dict['identifier'])
+    pkg_id = pkg_dict.get('id')
+    identifier_cache.invalidate_values(lambda dataset: dataset['id'] == pkg_id)
+
+
+def _quote_solr_value(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+@side_effect_free
+def ogdch_datasets_by_identifiers(context, data_dict):
+    '''
+    Returns name and title of the datasets with the given identifiers
+    (a list or a comma-separated string) as a dict by identifier.
+    All datasets are looked up with a single search query, identifiers
+    without a dataset are left out.
+    '''
+    context.update(ogdch_helpers.get_site_user_context())
+    identifiers = get_or_bust(data_dict, 'identifiers')
+    if isinstance(identifiers, basestring):
+        identifiers = identifiers.split(',')
+    identifiers = set(i.strip() for i in identifiers if i and i.strip())
+    if not identifiers:
+        return {}
+
+    param = 'identifier:(%s)' % ' OR '.join(
+        _quote_solr_value(i) for i in identifiers)
+    result = tk.get_action('package_search')(context, {
+        'fq': param,
+        'fl': 'identifier,name,title',
+        'rows': len(identifiers),
+    })
+
+    datasets = {}
+    for dataset in result['results']:
+        datasets.setdefault(dataset.get('identifier'), {
+            'name': dataset.get('name'),
+            'title': ogdch_helpers.parse_json(dataset.get('title')),
+        })
+    return datasets
+
+
 @side_effect_free
 def ogdch_autosuggest(context, data_dict):
+    '''
+    Returns suggestions for the search term q in the language lang.
+    lang may also be a comma-separated list of languages (e.g. de,fr),
+    the suggestions of all of them are then loaded with a single
+    Solr request and merged.
+    '''
     q = get_or_bust(data_dict, 'q')
-    lang = get_or_bust(data_dict, 'lang')
+    langs = _get_langs(data_dict)
     fq = data_dict.get('fq', '')
 
     if fq:
@@ -199,46 +520,264 @@ def ogdch_autosuggest(context, data_dict):
     else:
         fq = 'NOT private'
 
-    # parse language from values like de_CH
-    if len(lang) > 2:
-        lang = lang[:2]
+    # the highlighting does not depend on the case and surrounding
+    # whitespace of q, so all its variants share the same entry
+    q = q.strip().lower()
+    # organizations, groups and formats are suggested from the prefix
+    # index, which does not know about the context of a filter query
+    include_vocabularies = not data_dict.get('fq')
+    return list(autosuggest_cache.get_or_load(
+        (q, langs, fq),
+        lambda: _load_suggestions(q, langs, fq, include_vocabularies)))
 
-    if lang not in ['en', 'it', 'de', 'fr']:
-        raise ValidationError('lang must be one of [en, it, de, fr]')
 
-    handler = '/suggest_%s' % lang
-    suggester = 'ckanSuggester_%s' % lang
+def _get_langs(data_dict, field='lang'):
+    '''
+    Returns the sorted tuple of the two-letter language codes
+    requested as comma-separated list in data_dict
+    '''
+    value = get_or_bust(data_dict, field)
+    langs = set(
+        _get_lang({field: lang.strip()}, field)
+        for lang in value.split(',') if lang.strip()
+    )
+    if not langs:
+        raise ValidationError('%s must be one of [en, it, de, fr]' % field)
+    return tuple(sorted(langs))
+
+
+def _load_suggestions(q, langs, fq, include_vocabularies=True):
+    suggesters = ['ckanSuggester_%s' % lang for lang in langs]
+    params = {'suggest.q': q, 'suggest.count': 10, 'suggest.cfq': fq}
+    if len(langs) == 1:
+        handler = '/suggest_%s' % langs[0]
+    else:
+        handler = '/suggest'
+        params['suggest.dictionary'] = suggesters
 
-    solr = make_connection()
+    solr = _get_suggest_connection()
     try:
         log.debug(
-            'Loading suggestions for %s (lang: %s, fq: %s)' % (q, lang, fq)
-        )
-        results = solr.search(
-            '',
-            search_handler=handler,
-            **{'suggest.q': q, 'suggest.count': 10, 'suggest.cfq': fq}
+            'Loading suggestions for %s (lang: %s, fq: %s)'
+            % (q, ','.join(langs), fq)
         )
-        suggestions = results.raw_response['suggest'][suggester].values()[0]  # noqa
-
-        def highlight(term, q):
-            if '<b>' in term:
-                return term
-            clean_q = unidecode(q)
-            clean_term = unidecode(term)
-
-            re_q = re.escape(clean_q)
-            m = re.search(re_q, clean_term, re.I)
-            if m:
-                replace_text = term[m.start():m.end()]
-                term = term.replace(replace_text, '<b>%s</b>' % replace_text)
+        results = solr.search('', search_handler=handler, **params)
+        suggestions = [
+            suggestion
+            for suggester in suggesters
+            for suggestion in results.raw_response['suggest'][suggester].values()[0]['suggestions']  # noqa
+        ]
+    except pysolr.SolrError as e:
+        log.exception('Could not load suggestions from solr: %s' % e)
+        raise ActionError('Error retrieving suggestions from solr')
+
+    highlight = _get_highlighter(q)
+    terms = [highlight(suggestion['term']) for suggestion in suggestions]
+    if include_vocabularies:
+        try:
+            for lang in langs:
+                terms.extend(
+                    highlight(term)
+                    for term in ogdch_suggest.get_prefix_index(lang).search(q))  # noqa
+        except pysolr.SolrError as e:
+            log.exception('Could not build the prefix index: %s' % e)
+    # the prefix index finds terms that solr suggests as well
+    unique_terms = OrderedDict()
+    for term in terms:
+        unique_terms.setdefault(re.sub(r'</?b>', '', term).lower(), term)
+    return tuple(unique_terms.values())
+
+
+def _get_highlighter(q):
+    '''
+    Returns a function that highlights q in a suggested term
+    '''
+    re_q = re.compile(re.escape(unidecode(q)), re.I)
+
+    def highlight(term):
+        if '<b>' in term:
             return term
+        m = re_q.search(unidecode(term))
+        if m:
+            replace_text = term[m.start():m.end()]
+            term = term.replace(replace_text, '<b>%s</b>' % replace_text)
+        return term
+    return highlight
+
+
+def _get_suggest_connection():
+    '''
+    Returns a Solr connection that is reused for all suggest requests
+    of the process, so that its HTTP connections are kept alive
+    '''
+    global _suggest_connection
+    if _suggest_connection is None:
+        _suggest_connection = make_connection()
+    return _suggest_connection
 
-        terms = [highlight(suggestion['term'], q) for suggestion in suggestions['suggestions']]  # noqa
-        return list(set(terms))
+
+def ogdch_autosuggest_build(context, data_dict):
+    '''
+    Rebuilds the suggesters of all languages and clears the cached
+    suggestions of this process. Only sysadmins may call this action.
+    '''
+    if not authz.is_sysadmin(context.get('user')):
+        raise NotAuthorized
+    solr = _get_suggest_connection()
+    try:
+        solr.search(
+            '',
+            search_handler='/suggest',
+            **{'suggest.buildAll': 'true'}
+        )
     except pysolr.SolrError as e:
-        log.exception('Could not load suggestions from solr: %s' % e)
-    raise ActionError('Error retrieving suggestions from solr')
+        log.exception('Could not build the suggesters: %s' % e)
+        raise ActionError('Error building the suggesters in solr')
+    finally:
+        autosuggest_cache.clear()
+    return {'success': True}
+
+
+@side_effect_free
+def ogdch_cache_stats(context, data_dict):
+    '''
+    Returns size, hits and misses of all caches of the
+    process that handles the request
+    '''
+    return ogdch_cache.get_cache_stats()
+
+
+@chained_action
+def ckanext_showcase_package_association_create(up_func, context, data_dict):
+    '''
+    Invalidates the cached responses of ogdch_package_show and reindexes
+    the dataset that is added to a showcase
+    '''
+    result = up_func(context, data_dict)
+    _invalidate_showcase_association(context, data_dict)
+    return result
+
+
+@chained_action
+def ckanext_showcase_package_association_delete(up_func, context, data_dict):
+    '''
+    Invalidates the cached responses of ogdch_package_show and reindexes
+    the dataset that is removed from a showcase
+    '''
+    result = up_func(context, data_dict)
+    _invalidate_showcase_association(context, data_dict)
+    return result
+
+
+def _invalidate_showcase_association(context, data_dict):
+    for field in ('package_id', 'showcase_id'):
+        if data_dict.get(field):
+            invalidate_package_show_cache(data_dict[field], context['model'])
+    # the search document of a dataset contains its showcases
+    if data_dict.get('package_id'):
+        reindex_datasets([data_dict['package_id']])
+
+
+@chained_action
+def ckanext_showcase_delete(up_func, context, data_dict):
+    '''
+    Reindexes the datasets of a showcase after it has been deleted. The
+    showcase is purged together with its associations, so the datasets
+    are looked up before.
+    '''
+    model = context['model']
+    showcase = model.Package.get(get_or_bust(data_dict, 'id'))
+    package_ids = []
+    if showcase is not None:
+        package_ids = [
+            row[0] for row in
+            ShowcasePackageAssociation.get_package_ids_for_showcase(
+                showcase.id)]
+    result = up_func(context, data_dict)
+    for package_id in package_ids:
+        invalidate_package_show_cache(package_id, model)
+    enqueue_reindex_datasets(package_ids)
+    return result
+
+
+def reindex_datasets(package_ids):
+    '''
+    Updates the search documents of the given datasets
+    '''
+    for package_id in package_ids:
+        search.rebuild(package_id)
+
+
+def reindex_datasets_job(package_ids):
+    '''
+    Background job that updates the search documents of the given
+    datasets and commits to solr once at the end
+    '''
+    for package_id in package_ids:
+        search.rebuild(package_id, defer_commit=True)
+    search.commit()
+
+
+def enqueue_reindex_datasets(package_ids):
+    '''
+    Updates the search documents of the given datasets in a background
+    job (run by paster jobs worker) instead of in the current request
+    '''
+    if package_ids:
+        tk.enqueue_job(reindex_datasets_job, [list(package_ids)],
+                       title='Reindex %s datasets' % len(package_ids))
+
+
+@chained_action
+def user_update(up_func, context, data_dict):
+    '''
+    Reloads the memoized site user after it has been updated
+    '''
+    result = up_func(context, data_dict)
+    ogdch_helpers.invalidate_site_user(result['id'])
+    return result
+
+
+@chained_action
+def tag_create(up_func, context, data_dict):
+    '''
+    Clears the cached showcase types when a tag is added to a vocabulary
+    '''
+    result = up_func(context, data_dict)
+    if data_dict.get('vocabulary_id'):
+        ogdch_helpers.invalidate_showcase_types()
+    return result
+
+
+@chained_action
+def tag_delete(up_func, context, data_dict):
+    '''
+    Clears the cached showcase types when a tag of a vocabulary is deleted
+    '''
+    result = up_func(context, data_dict)
+    if data_dict.get('vocabulary_id'):
+        ogdch_helpers.invalidate_showcase_types()
+    return result
+
+
+@chained_action
+def vocabulary_update(up_func, context, data_dict):
+    '''
+    Clears the cached showcase types when the tags of a vocabulary change
+    '''
+    result = up_func(context, data_dict)
+    ogdch_helpers.invalidate_showcase_types()
+    return result
+
+
+@chained_action
+def vocabulary_delete(up_func, context, data_dict):
+    '''
+    Clears the cached showcase types when a vocabulary is deleted
+    '''
+    result = up_func(context, data_dict)
+    ogdch_helpers.invalidate_showcase_types(vocabulary_deleted=True)
+    return result
 
 
 def ogdch_cleanup_harvestjobs(context, data_dict):
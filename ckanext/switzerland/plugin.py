@@ -2,20 +2,25 @@
 
 from ckan.common import OrderedDict
 from ckanext.showcase.plugin import ShowcasePlugin
+from ckanext.showcase.model import ShowcasePackageAssociation
 from ckanext.switzerland import validators as v
 from ckanext.switzerland import logic as l
 import ckanext.switzerland.helpers as sh
+import ckanext.switzerland.cache as ogdch_cache
+import ckanext.switzerland.suggest as ogdch_suggest
+import ckanext.switzerland.linkcheck as ogdch_linkcheck
 
 import ckan.plugins as plugins
 from ckan.lib.plugins import DefaultTranslation
 import ckanext.xloader.interfaces as ix
 import ckan.plugins.toolkit as toolkit
-from ckan import logic
 import ckan.lib.helpers as h
 from ckan.lib.munge import munge_title_to_name
 import json
 import re
+import marshal
 import collections
+import contextlib
 from webhelpers.html import HTML
 from webhelpers import paginate
 import urlparse
@@ -29,9 +34,12 @@ __location__ = os.path.realpath(os.path.join(
     os.path.dirname(__file__))
 )
 
+package_view_cache = ogdch_cache.LRUCache('package_view', ttl=600)
+
 
 class OgdchPlugin(plugins.SingletonPlugin, DefaultTranslation):
     plugins.implements(plugins.IConfigurer)
+    plugins.implements(plugins.IConfigurable, inherit=True)
     plugins.implements(plugins.IValidators)
     plugins.implements(plugins.IFacets)
     plugins.implements(plugins.IActions)
@@ -48,6 +56,13 @@ class OgdchPlugin(plugins.SingletonPlugin, DefaultTranslation):
     def update_config(self, config_):
         toolkit.add_template_directory(config_, 'templates')
         toolkit.add_public_directory(config_, 'public')
+        ogdch_cache.configure_caches(config_)
+
+    # IConfigurable
+
+    def configure(self, config_):
+        # create the table of the link check results if necessary
+        ogdch_linkcheck.setup()
 
     # IValidators
 
@@ -105,41 +120,65 @@ class OgdchPlugin(plugins.SingletonPlugin, DefaultTranslation):
         """
         Expose new API methods
         """
-        return {
+        actions = {
             'ogdch_counts': l.ogdch_counts,
             'ogdch_dataset_terms_of_use': l.ogdch_dataset_terms_of_use,
             'ogdch_dataset_by_identifier': l.ogdch_dataset_by_identifier,
+            'ogdch_dataset_name_by_identifier': l.ogdch_dataset_name_by_identifier,  # noqa
+            'ogdch_datasets_by_identifiers': l.ogdch_datasets_by_identifiers,  # noqa
             'ogdch_content_headers': l.ogdch_content_headers,
+            'ogdch_content_headers_batch': l.ogdch_content_headers_batch,
             'ogdch_autosuggest': l.ogdch_autosuggest,
+            'ogdch_autosuggest_build': l.ogdch_autosuggest_build,
             'ogdch_cleanup_harvestjobs': l.ogdch_cleanup_harvestjobs,
             'ogdch_shacl_validate': l.ogdch_shacl_validate,
             'ogdch_package_show': l.ogdch_package_show,
+            'package_show': l.package_show,
             'ogdch_showcase_search': l.ogdch_showcase_search,
+            'ogdch_cache_stats': l.ogdch_cache_stats,
+            'user_update': l.user_update,
+            'tag_create': l.tag_create,
+            'tag_delete': l.tag_delete,
+            'vocabulary_update': l.vocabulary_update,
+            'vocabulary_delete': l.vocabulary_delete,
         }
+        # the showcase actions can only be chained if they exist
+        if sh.showcases_enabled():
+            actions.update({
+                'ckanext_showcase_package_association_create':
+                    l.ckanext_showcase_package_association_create,
+                'ckanext_showcase_package_association_delete':
+                    l.ckanext_showcase_package_association_delete,
+                'ckanext_showcase_delete': l.ckanext_showcase_delete,
+            })
+        return actions
 
     # ITemplateHelpers
 
     def get_helpers(self):
         """
-        Provide template helper functions
+        Provide template helper functions. Lookups that are called
+        several times while rendering a page are memoized per request.
         """
+        memoize = ogdch_cache.memoize_per_request
         return {
             'get_dataset_count': sh.get_dataset_count,
             'get_group_count': sh.get_group_count,
             'get_org_count': sh.get_org_count,
-            'get_localized_org': sh.get_localized_org,
+            'get_localized_org': memoize(sh.get_localized_org),
             'localize_json_title': sh.localize_json_title,
             'get_frequency_name': sh.get_frequency_name,
             'get_political_level': sh.get_political_level,
             'get_terms_of_use_icon': sh.get_terms_of_use_icon,
             'get_dataset_terms_of_use': sh.get_dataset_terms_of_use,
-            'get_dataset_by_identifier': sh.get_dataset_by_identifier,
+            'get_dataset_by_identifier': memoize(sh.get_dataset_by_identifier),  # noqa
+            'get_related_datasets': sh.get_related_datasets,
             'get_readable_file_size': sh.get_readable_file_size,
             'get_piwik_config': sh.get_piwik_config,
             'ogdch_localised_number': sh.ogdch_localised_number,
             'ogdch_render_tree': sh.ogdch_render_tree,
             'ogdch_group_tree': sh.ogdch_group_tree,
-            'get_showcases_for_dataset': sh.get_showcases_for_dataset,
+            'get_showcases_for_dataset': memoize(sh.get_showcases_for_dataset),  # noqa
             'get_terms_of_use_url': sh.get_terms_of_use_url,
             'get_localized_newsletter_url': sh.get_localized_newsletter_url,
         }
@@ -155,13 +194,33 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
     """
     plugins.implements(plugins.IConfigurer)
 
+    # reduction plan used for the top-level fields of the data_dict
+    schema_type = 'dataset'
+
+    # format mapping and index are shared by all subclasses, together
+    # with the mapping the index was built from
+    format_mapping = None
+    format_index = None
+    format_index_mapping = None
+
     # IConfigurer
 
     def update_config(self, config):
+        # compile the reduction plans once at startup
+        sh.get_reduction_plans()
+
+        if OgdchLanguagePlugin.format_index is None:
+            format_mapping = self._load_format_mapping()
+            OgdchLanguagePlugin.format_mapping = format_mapping
+            OgdchLanguagePlugin.format_index = sh.build_format_index(
+                format_mapping)
+            OgdchLanguagePlugin.format_index_mapping = format_mapping
+
+    def _load_format_mapping(self):
         try:
             mapping_path = os.path.join(__location__, 'mapping.yaml')
             with open(mapping_path, 'r') as format_mapping_file:
-                self.format_mapping = yaml.safe_load(format_mapping_file)
+                return yaml.safe_load(format_mapping_file)
         except (IOError, yaml.YAMLError) as exception:
             raise FormatMappingNotLoadedError(
                 'Loading Format-Mapping from Path: (%s) '
@@ -172,17 +231,29 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
     def get_format_mapping(self):
         return self.format_mapping
 
+    def get_format_index(self):
+        # an instance with its own mapping (e.g. in tests) gets its own
+        # index instead of the shared one
+        format_mapping = self.get_format_mapping()
+        if self.format_index is None or \
+                self.format_index_mapping is not format_mapping:
+            self.format_index = sh.build_format_index(format_mapping)
+            self.format_index_mapping = format_mapping
+        return self.format_index
+
     def before_view(self, pkg_dict):
         pkg_dict = self._prepare_package_json(pkg_dict)
 
         return pkg_dict
 
-    def _ignore_field(self, key):
-        return False
-
     def _prepare_package_json(self, pkg_dict):
-        # parse all json strings in dict
-        pkg_dict = self._package_parse_json_strings(pkg_dict)
+        # parse all json strings and replace language dicts with the
+        # requested language strings in a single pass
+        pkg_dict = sh.reduce_package(
+            pkg_dict,
+            self._get_view_language(),
+            self.schema_type
+        )
 
         # map ckan fields
         pkg_dict = self._package_map_ckan_default_fields(pkg_dict)
@@ -190,6 +261,9 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
         # prepare format of resources
         pkg_dict = self._prepare_resources_format(pkg_dict)
 
+        return pkg_dict
+
+    def _get_view_language(self):
         try:
             # Do not change the resulting dict for API requests
             path = toolkit.request.path
@@ -202,18 +276,12 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
                 path.endswith('.jsonld'),
 
             ]):
-                return pkg_dict
+                return None
         except TypeError:
             # we get here if there is no request (i.e. on the command line)
-            return pkg_dict
+            return None
 
-        # replace langauge dicts with requested language strings
-        desired_lang_code = self._get_request_language()
-        pkg_dict = self._package_reduce_to_requested_language(
-            pkg_dict, desired_lang_code
-        )
-
-        return pkg_dict
+        return self._get_request_language()
 
     def _get_request_language(self):
         try:
@@ -221,31 +289,6 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
         except TypeError:
             return toolkit.config.get('ckan.locale_default', 'en')
 
-    def _package_parse_json_strings(self, pkg_dict):
-        # try to parse all values as JSON
-        for key, value in pkg_dict.iteritems():
-            pkg_dict[key] = sh.parse_json(value)
-
-        # groups
-        if 'groups' in pkg_dict and pkg_dict['groups'] is not None:
-            for group in pkg_dict['groups']:
-                """
-                TODO: somehow the title is messed up here,
-                but the display_name is okay
-                """
-                group['title'] = group['display_name']
-                for field in group:
-                    group[field] = sh.parse_json(group[field])
-
-        # organization
-        if 'organization' in pkg_dict and pkg_dict['organization'] is not None:
-            for field in pkg_dict['organization']:
-                pkg_dict['organization'][field] = sh.parse_json(
-                    pkg_dict['organization'][field]
-                )
-
-        return pkg_dict
-
     def _package_map_ckan_default_fields(self, pkg_dict):  # noqa
         pkg_dict['display_name'] = pkg_dict['title']
 
@@ -286,34 +329,21 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
 
     # Generates format of resource and saves it in format field
     def _prepare_resource_format(self, resource):
-        resource_format = ''
-
-        # get format from media_type field if available
-        if not resource_format and resource.get('media_type'):  # noqa
-            resource_format = resource['media_type'].split('/')[-1].lower()
+        format_index = self.get_format_index()
 
-        # get format from format field if available (lol)
-        if not resource_format and resource.get('format'):
-            resource_format = resource['format'].split('/')[-1].lower()
-
-        # check if 'media_type' or 'format' can be mapped
-        has_format = (sh.map_to_valid_format(
-            resource_format,
-            self.get_format_mapping()
-        ) is not None)
+        # get format from media_type field if available,
+        # otherwise from the format field
+        resource_format = (
+            resource.get('media_type') or resource.get('format') or '')
+        mapped_format = sh.map_to_valid_format(resource_format, format_index)
 
         # if the fields can't be mapped,
         # try to parse the download_url as a last resort
-        if not has_format and resource.get('download_url'):
+        if mapped_format is None and resource.get('download_url'):
             path = urlparse.urlparse(resource['download_url']).path
             ext = os.path.splitext(path)[1]
-            if ext:
-                resource_format = ext.replace('.', '').lower()
+            mapped_format = sh.map_to_valid_format(ext, format_index)
 
-        mapped_format = sh.map_to_valid_format(
-            resource_format,
-            self.get_format_mapping()
-        )
         if mapped_format:
             # if format could be successfully mapped write it to format field
             resource['format'] = mapped_format
@@ -325,96 +355,70 @@ class OgdchLanguagePlugin(plugins.SingletonPlugin):
 
         return resource
 
-    def _extract_lang_value(self, value, lang_code):
-        new_value = sh.parse_json(value)
 
-        if isinstance(new_value, dict):
-            return sh.get_localized_value(
-                new_value,
-                lang_code,
-                default_value=''
-            )
-        return value
-
-    def _package_reduce_to_requested_language(self, pkg_dict, desired_lang_code):  # noqa
-        # pkg fields
-        for key, value in pkg_dict.iteritems():
-            if not self._ignore_field(key):
-                pkg_dict[key] = self._extract_lang_value(
-                    value,
-                    desired_lang_code
-                )
+class OgdchGroupPlugin(OgdchLanguagePlugin):
+    plugins.implements(plugins.IGroupController, inherit=True)
 
-        # groups
-        pkg_dict = self._reduce_group_language(pkg_dict, desired_lang_code)
+    schema_type = 'group'
 
-        # organization
-        pkg_dict = self._reduce_org_language(pkg_dict, desired_lang_code)
+    # IGroupController
+    def before_view(self, pkg_dict):
+        return super(OgdchGroupPlugin, self).before_view(pkg_dict)
 
-        # resources
-        pkg_dict = self._reduce_res_language(pkg_dict, desired_lang_code)
+    def create(self, entity):
+        sh.invalidate_group_lists(entity.type)
+        ogdch_suggest.invalidate_prefix_index()
 
-        return pkg_dict
+    def edit(self, entity):
+        sh.invalidate_group_lists(entity.type)
+        ogdch_suggest.invalidate_prefix_index()
 
-    def _reduce_group_language(self, pkg_dict, desired_lang_code):
-        if 'groups' in pkg_dict and pkg_dict['groups'] is not None:
-            try:
-                for element in pkg_dict['groups']:
-                    for field in element:
-                        element[field] = self._extract_lang_value(
-                            element[field],
-                            desired_lang_code
-                        )
-            except TypeError:
-                pass
+    def delete(self, entity):
+        sh.invalidate_group_lists(entity.type)
+        ogdch_suggest.invalidate_prefix_index()
 
-        return pkg_dict
 
-    def _reduce_org_language(self, pkg_dict, desired_lang_code):
-        if 'organization' in pkg_dict and pkg_dict['organization'] is not None:
-            try:
-                for field in pkg_dict['organization']:
-                    pkg_dict['organization'][field] = self._extract_lang_value(
-                        pkg_dict['organization'][field],
-                        desired_lang_code
-                    )
-            except TypeError:
-                pass
-        return pkg_dict
+class OgdchOrganizationPlugin(OgdchLanguagePlugin):
+    plugins.implements(plugins.IOrganizationController, inherit=True)
+    plugins.implements(plugins.IMiddleware, inherit=True)
 
-    def _reduce_res_language(self, pkg_dict, desired_lang_code):
-        if 'resources' in pkg_dict and pkg_dict['resources'] is not None:
-            try:
-                for element in pkg_dict['resources']:
-                    for field in element:
-                        element[field] = self._extract_lang_value(
-                            element[field],
-                            desired_lang_code
-                        )
-            except TypeError:
-                pass
-        return pkg_dict
+    schema_type = 'organization'
 
+    # IMiddleware
 
-class OgdchGroupPlugin(OgdchLanguagePlugin):
-    plugins.implements(plugins.IGroupController, inherit=True)
+    def make_middleware(self, app, config):
+        # the database is only available once the environment is loaded,
+        # so the organization tree is rendered here instead of in configure
+        if toolkit.asbool(config.get(
+                'ckanext.switzerland.warm_up_organization_tree', False)):
+            try:
+                sh.warm_up_organization_tree()
+            except Exception:
+                log.exception('Could not warm up the organization tree')
+        return app
 
-    # IGroupController
+    # IOrganizationController
     def before_view(self, pkg_dict):
-        return super(OgdchGroupPlugin, self).before_view(pkg_dict)
+        return super(OgdchOrganizationPlugin, self).before_view(pkg_dict)
 
+    def create(self, entity):
+        sh.invalidate_organization(entity.id)
+        ogdch_suggest.invalidate_prefix_index()
 
-class OgdchOrganizationPlugin(OgdchLanguagePlugin):
-    plugins.implements(plugins.IOrganizationController, inherit=True)
+    def edit(self, entity):
+        sh.invalidate_organization(entity.id)
+        ogdch_suggest.invalidate_prefix_index()
 
-    # IOrganizationController
-    def before_view(self, pkg_dict):
-        return super(OgdchOrganizationPlugin, self).before_view(pkg_dict)
+    def delete(self, entity):
+        sh.invalidate_organization(entity.id)
+        ogdch_suggest.invalidate_prefix_index()
 
 
 class OgdchResourcePlugin(OgdchLanguagePlugin):
     plugins.implements(plugins.IResourceController, inherit=True)
 
+    schema_type = 'resource'
+
     # IResourceController
     def before_show(self, res_dict):
         res_dict = super(OgdchResourcePlugin, self).before_view(res_dict)
@@ -426,8 +430,26 @@ class OgdchResourcePlugin(OgdchLanguagePlugin):
 
         return res_dict
 
-    def _ignore_field(self, key):
-        return key == 'tracking_summary'
+
+def _dump_fields(pkg_dict):
+    # marshal is much faster than deepcopy for plain data, but raises a
+    # ValueError for other types
+    return dict((key, marshal.dumps(value))
+                for key, value in pkg_dict.items())
+
+
+def _get_changed_fields(original_fields, pkg_dict):
+    """
+    Returns the fields of pkg_dict that differ from the original fields
+    (as marshalled string) and the keys that have been removed
+    """
+    changed = {}
+    for key, value in pkg_dict.items():
+        dumped = marshal.dumps(value)
+        if original_fields.get(key) != dumped:
+            changed[key] = value
+    removed = [key for key in original_fields if key not in pkg_dict]
+    return marshal.dumps(changed), removed
 
 
 class OgdchPackagePlugin(OgdchLanguagePlugin):
@@ -435,6 +457,9 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
     plugins.implements(plugins.IRoutes, inherit=True)
     plugins.implements(ix.IXloader, inherit=True)
 
+    # set while paster ogdch reindex builds a batch of search documents
+    _defer_before_index = False
+
     def is_supported_package_type(self, pkg_dict):
         # only package type 'dataset' is supported (not harvesters!)
         try:
@@ -448,19 +473,81 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
         map.connect('perma_redirect', '/perma/{id}',
                     controller='ckanext.switzerland.controller:OgdchPermaController',  # noqa
                     action='read')
+        # conditional GET requests for ogdch_package_show
+        for path in ['/api/action/ogdch_package_show',
+                     '/api/{ver:3}/action/ogdch_package_show']:
+            map.connect(path,
+                        controller='ckanext.switzerland.controller:OgdchApiController',  # noqa
+                        action='package_show',
+                        conditions=dict(method=['GET']))
         return map
 
     # IPackageController
 
-#     TODO: before_view isn't called in API requests -> after_show is
-#           BUT (!) after_show is also called when packages get indexed
-#           and there we need all languages.
-#           -> find a solution to _prepare_package_json() in an API call.
-#     def after_show(self, context, pkg_dict):
-#         if not self.is_supported_package_type(pkg_dict):
-#             return pkg_dict
-#
-#         return super(OgdchPackagePlugin, self).before_view(pkg_dict)
+    def before_view(self, pkg_dict):
+        # the localized fields only depend on the dataset, its organization,
+        # the language and the shape of the dict (package_show and search
+        # results differ), so they can be reused until the dataset changes
+        try:
+            cache_key = (
+                pkg_dict['id'],
+                pkg_dict['metadata_modified'],
+                (pkg_dict.get('organization') or {}).get('revision_id'),
+                self._get_view_language(),
+                frozenset(pkg_dict),
+            )
+        except KeyError:
+            return super(OgdchPackagePlugin, self).before_view(pkg_dict)
+
+        cached_fields = package_view_cache.get(cache_key)
+        if cached_fields is None:
+            try:
+                original_fields = _dump_fields(pkg_dict)
+            except ValueError:
+                return super(OgdchPackagePlugin, self).before_view(pkg_dict)
+            pkg_dict = super(OgdchPackagePlugin, self).before_view(pkg_dict)
+            try:
+                package_view_cache.set(
+                    cache_key, _get_changed_fields(original_fields, pkg_dict))
+            except ValueError:
+                pass
+            return pkg_dict
+
+        # only the changed fields are cached, they are merged into the
+        # caller's dict instead of copying the whole dataset
+        changed_fields, removed_keys = cached_fields
+        pkg_dict.update(marshal.loads(changed_fields))
+        for key in removed_keys:
+            pkg_dict.pop(key, None)
+        return pkg_dict
+
+    def after_create(self, context, pkg_dict):
+        l.invalidate_identifier_cache(pkg_dict)
+        l.invalidate_counts_cache()
+
+    def after_update(self, context, pkg_dict):
+        self._invalidate_view_cache(pkg_dict)
+        l.invalidate_identifier_cache(pkg_dict)
+        self._reindex_datasets_of_showcase(pkg_dict)
+
+    def after_delete(self, context, pkg_dict):
+        self._invalidate_view_cache(pkg_dict)
+        l.invalidate_identifier_cache(pkg_dict)
+        l.invalidate_counts_cache()
+        self._reindex_datasets_of_showcase(pkg_dict)
+
+    def _reindex_datasets_of_showcase(self, pkg_dict):
+        # the search documents of datasets contain their showcases
+        if pkg_dict.get('type') == 'showcase' and pkg_dict.get('id'):
+            package_ids = \
+                ShowcasePackageAssociation.get_package_ids_for_showcase(
+                    pkg_dict['id'])
+            l.enqueue_reindex_datasets([row[0] for row in package_ids])
+
+    def _invalidate_view_cache(self, pkg_dict):
+        pkg_id = pkg_dict.get('id')
+        package_view_cache.invalidate(lambda key: key[0] == pkg_id)
+        l.package_show_cache.invalidate(lambda key: key[0] == pkg_id)
 
     def after_show(self, context, pkg_dict):
         if not self.is_supported_package_type(pkg_dict):
@@ -470,57 +557,75 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
 
         # groups
         if pkg_dict['groups'] is not None:
+            group_plan = sh.get_reduction_plans()['group']
             for group in pkg_dict['groups']:
                 """
                 TODO: somehow the title is messed up here,
                 but the display_name is okay
                 """
                 group['title'] = group['display_name']
-                for field in group:
-                    group[field] = sh.parse_json(group[field])
+                sh.reduce_fields(group, group_plan)
 
         # load organization from API to get all fields defined in schema
         # by default, CKAN loads organizations only from the database
         if pkg_dict['owner_org'] is not None:
-            pkg_dict['organization'] = logic.get_action('organization_show')(
-                {},
-                {
-                    'id': pkg_dict['owner_org'],
-                    'include_users': False,
-                    'include_followers': False,
-                }
+            pkg_dict['organization'] = sh.get_organization_dict(
+                pkg_dict['owner_org'],
+                (pkg_dict.get('organization') or {}).get('revision_id')
             )
 
         return pkg_dict
 
     def before_index(self, search_data):
+        if self._defer_before_index:
+            return search_data
+        return self._prepare_search_data(search_data)
+
+    @contextlib.contextmanager
+    def deferred_before_index(self):
+        """
+        Skips before_index while the search documents of a batch are
+        built, so that they can be prepared by before_index_batch
+        """
+        self._defer_before_index = True
+        try:
+            yield
+        finally:
+            self._defer_before_index = False
+
+    def before_index_batch(self, search_data_list):
+        """
+        Prepares many search documents at once (used by paster ogdch
+        reindex). Resource formats and organization titles are only
+        computed once per batch.
+        """
+        memo = {'formats': {}, 'organizations': {}}
+        return [
+            self._prepare_search_data(search_data, memo)
+            for search_data in search_data_list
+        ]
+
+    def _prepare_search_data(self, search_data, memo=None):
         if not self.is_supported_package_type(search_data):
             return search_data
 
-        extract_title = LangToString('title')
         validated_dict = json.loads(search_data['validated_data_dict'])
+        if memo is None:
+            memo = {'formats': {}, 'organizations': {}}
 
-        search_data['res_name'] = [extract_title(r) for r in validated_dict[u'resources']]  # noqa
-        search_data['res_name_en'] = [sh.get_localized_value(r['title'], 'en') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_name_de'] = [sh.get_localized_value(r['title'], 'de') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_name_fr'] = [sh.get_localized_value(r['title'], 'fr') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_name_it'] = [sh.get_localized_value(r['title'], 'it') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_description_en'] = [sh.get_localized_value(r['description'], 'en') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_description_de'] = [sh.get_localized_value(r['description'], 'de') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_description_fr'] = [sh.get_localized_value(r['description'], 'fr') for r in validated_dict[u'resources']]  # noqa
-        search_data['res_description_it'] = [sh.get_localized_value(r['description'], 'it') for r in validated_dict[u'resources']]  # noqa
-        search_data['groups_en'] = [sh.get_localized_value(g['display_name'], 'en') for g in validated_dict[u'groups']]  # noqa
-        search_data['groups_de'] = [sh.get_localized_value(g['display_name'], 'de') for g in validated_dict[u'groups']]  # noqa
-        search_data['groups_fr'] = [sh.get_localized_value(g['display_name'], 'fr') for g in validated_dict[u'groups']]  # noqa
-        search_data['groups_it'] = [sh.get_localized_value(g['display_name'], 'it') for g in validated_dict[u'groups']]  # noqa
-        search_data['res_description'] = [LangToString('description')(r) for r in validated_dict[u'resources']]  # noqa
-        search_data['res_format'] = self._prepare_formats_for_index(validated_dict[u'resources'])  # noqa
-        search_data['res_rights'] = [sh.simplify_terms_of_use(r['rights']) for r in validated_dict[u'resources'] if 'rights' in r.keys()]  # noqa
+        extract_title = LangToString('title')
+
+        search_data = self._prepare_resources_for_index(
+            search_data, validated_dict[u'resources'], memo)
+        search_data = self._prepare_groups_for_index(
+            search_data, validated_dict[u'groups'])
         search_data['title_string'] = extract_title(validated_dict)
         search_data['description'] = LangToString('description')(validated_dict)  # noqa
         if 'political_level' in validated_dict[u'organization']:
             search_data['political_level'] = validated_dict[u'organization'][u'political_level']  # noqa
 
+        search_data['dataset_rights'] = sh.get_least_open_terms_of_use(
+            validated_dict[u'resources'])
         search_data['identifier'] = validated_dict.get('identifier')
         search_data['contact_points'] = [c['name'] for c in validated_dict.get('contact_points', [])]  # noqa
         search_data['publishers'] = [p['label'] for p in validated_dict.get('publishers', [])]  # noqa
@@ -542,15 +647,96 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
         if search_data['metadata_modified'] is None:
             search_data['metadata_modified'] = ''
 
+        search_data = self._prepare_languages_for_index(
+            search_data, validated_dict, memo)
+        search_data = self._prepare_showcases_for_index(
+            search_data, validated_dict)
+
+        # clean terms for suggest context
+        search_data = self._prepare_suggest_context(
+            search_data,
+            validated_dict
+        )
+
+        return search_data
+
+    def _prepare_showcases_for_index(self, search_data, validated_dict):
+        showcases = sh.load_showcases_for_dataset(validated_dict['id'])
+        search_data['showcases'] = json.dumps(showcases)
+        search_data['showcase_ids'] = [s['id'] for s in showcases]
+        search_data['has_showcase'] = bool(showcases)
+        return search_data
+
+    # fills all resource fields of the index in a single loop
+    def _prepare_resources_for_index(self, search_data, resources, memo):
+        extract_title = LangToString('title')
+        extract_description = LangToString('description')
+        lang_codes = sh.get_langs()
+
+        search_data['res_name'] = []
+        search_data['res_description'] = []
+        search_data['res_rights'] = []
+        for lang_code in lang_codes:
+            search_data['res_name_' + lang_code] = []
+            search_data['res_description_' + lang_code] = []
+        formats = set()
+
+        for resource in resources:
+            search_data['res_name'].append(extract_title(resource))
+            search_data['res_description'].append(
+                extract_description(resource))
+            for lang_code in lang_codes:
+                search_data['res_name_' + lang_code].append(
+                    sh.get_localized_value(resource['title'], lang_code))
+                search_data['res_description_' + lang_code].append(
+                    sh.get_localized_value(resource['description'], lang_code))
+            if 'rights' in resource:
+                search_data['res_rights'].append(
+                    sh.simplify_terms_of_use(resource['rights']))
+            formats.add(self._get_format_for_index(resource, memo) or 'N/A')
+
+        search_data['res_format'] = list(formats)
+        return search_data
+
+    def _get_format_for_index(self, resource, memo):
+        # the mapping only depends on the extension of the download_url
+        download_url = resource.get('download_url')
+        format_fields = (
+            resource.get('media_type'),
+            resource.get('format'),
+            bool(download_url),
+            os.path.splitext(urlparse.urlparse(download_url).path)[1]
+            if download_url else '',
+        )
+        if format_fields not in memo['formats']:
+            memo['formats'][format_fields] = self._prepare_resource_format({
+                'media_type': resource.get('media_type'),
+                'format': resource.get('format'),
+                'download_url': download_url,
+            })['format']
+        return memo['formats'][format_fields]
+
+    def _prepare_groups_for_index(self, search_data, groups):
+        lang_codes = sh.get_langs()
+        for lang_code in lang_codes:
+            search_data['groups_' + lang_code] = []
+        for group in groups:
+            for lang_code in lang_codes:
+                search_data['groups_' + lang_code].append(
+                    sh.get_localized_value(group['display_name'], lang_code))
+        return search_data
+
+    def _prepare_languages_for_index(self, search_data, validated_dict, memo):
         try:
             # index language-specific values (or it's fallback)
             for lang_code in sh.get_langs():
-                search_data['title_' + lang_code] = sh.get_localized_value(
+                title = sh.get_localized_value(
                     validated_dict['title'],
                     lang_code
                 )
+                search_data['title_' + lang_code] = title
                 search_data['title_string_' + lang_code] = munge_title_to_name(
-                    sh.get_localized_value(validated_dict['title'], lang_code)
+                    title
                 )
                 search_data['description_' + lang_code] = sh.get_localized_value(  # noqa
                     validated_dict['description'],
@@ -560,33 +746,26 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
                     validated_dict['keywords'],
                     lang_code
                 )
-                search_data['organization_' + lang_code] = sh.get_localized_value(  # noqa
-                    validated_dict['organization']['title'],
-                    lang_code
+                search_data['organization_' + lang_code] = self._get_organization_title_for_index(  # noqa
+                    validated_dict['organization'],
+                    lang_code,
+                    memo
                 )
 
         except KeyError:
             pass
 
-        # clean terms for suggest context
-        search_data = self._prepare_suggest_context(
-            search_data,
-            validated_dict
-        )
-
         return search_data
 
-    # generates a set with formats of all resources
-    def _prepare_formats_for_index(self, resources):
-        formats = set()
-        for r in resources:
-            resource = self._prepare_resource_format(r)
-            if resource['format']:
-                formats.add(resource['format'])
-            else:
-                formats.add('N/A')
-
-        return list(formats)
+    def _get_organization_title_for_index(self, organization, lang_code,
+                                          memo):
+        key = (organization.get('id'), lang_code)
+        if key[0] is None or key not in memo['organizations']:
+            memo['organizations'][key] = sh.get_localized_value(
+                organization['title'],
+                lang_code
+            )
+        return memo['organizations'][key]
 
     def _prepare_suggest_context(self, search_data, pkg_dict):
         def clean_suggestion(term):
@@ -675,6 +854,8 @@ class OgdchPackagePlugin(OgdchLanguagePlugin):
                 'package': dataset_dict,
             }
         )
+        # the cached responses of ogdch_package_show contain has_views
+        self._invalidate_view_cache(dataset_dict)
 
 
 class OgdchOrganisationSearchPlugin(plugins.SingletonPlugin):
@@ -0,0 +1,101 @@
+# coding=UTF-8
+
+import bisect
+from unidecode import unidecode
+import ckan.plugins.toolkit as tk
+from ckan import model
+from ckan.lib.search.common import make_connection
+import ckanext.switzerland.cache as ogdch_cache
+import ckanext.switzerland.helpers as ogdch_helpers
+
+import logging
+log = logging.getLogger(__name__)
+
+# prefix indexes of organizations, groups and formats by language
+prefix_index_cache = ogdch_cache.LRUCache('prefix_index', maxsize=4, ttl=3600)
+
+
+class PrefixIndex(object):
+    """
+    Finds the terms that contain a word starting with a prefix. For every
+    word of a term the normalized rest of the term starting at this word
+    is kept in a sorted list that is searched by bisection.
+    """
+
+    def __init__(self, terms):
+        entries = set()
+        for term in terms:
+            words = normalize(term).split()
+            for i in range(len(words)):
+                entries.add((' '.join(words[i:]), term))
+        entries = sorted(entries)
+        self._keys = [key for key, term in entries]
+        self._terms = [term for key, term in entries]
+
+    def search(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        terms = []
+        i = bisect.bisect_left(self._keys, prefix)
+        while i < len(self._keys) and len(terms) < limit \
+                and self._keys[i].startswith(prefix):
+            if self._terms[i] not in terms:
+                terms.append(self._terms[i])
+            i += 1
+        return terms
+
+
+def normalize(term):
+    if isinstance(term, str):
+        term = term.decode('utf-8')
+    return ' '.join(unidecode(term).lower().split())
+
+
+def get_prefix_index(lang_code):
+    """
+    Returns the prefix index of the titles of all organizations and
+    groups and of all formats that public datasets are related to
+    """
+    return prefix_index_cache.get_or_load(
+        lang_code, lambda: _build_prefix_index(lang_code))
+
+
+def invalidate_prefix_index():
+    prefix_index_cache.clear()
+
+
+def _build_prefix_index(lang_code):
+    facets = _get_vocabulary_facets()
+    names = facets['organization'] + facets['groups']
+    terms = []
+    if names:
+        groups = model.Session.query(model.Group.title).filter(
+            model.Group.name.in_(names),
+            model.Group.state == 'active',
+        )
+        terms.extend(
+            ogdch_helpers.get_translated_group_title(row.title, lang_code)
+            for row in groups)
+    terms.extend(f for f in facets['res_format'] if f != 'N/A')
+    return PrefixIndex(term for term in terms if term)
+
+
+def _get_vocabulary_facets():
+    solr = make_connection()
+    results = solr.search('*:*', **{
+        'fq': [
+            '+site_id:"%s"' % tk.config.get('ckan.site_id'),
+            '+state:active',
+            '+capacity:public',
+        ],
+        'rows': 0,
+        'facet': 'true',
+        'facet.field': ['organization', 'groups', 'res_format'],
+        'facet.limit': -1,
+        'facet.mincount': 1,
+    })
+    return dict(
+        (field, values[::2])
+        for field, values in results.facets['facet_fields'].items()
+    )
@@ -0,0 +1,108 @@
+"""Tests for cache.py."""
+from nose.tools import *  # noqa
+import mock
+import ckanext.switzerland.cache as cache
+import sys
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_and_set(self):
+        lru_cache = cache.LRUCache('test', maxsize=2)
+        self.assertIsNone(lru_cache.get('a'))
+        lru_cache.set('a', 1)
+        self.assertEqual(1, lru_cache.get('a'))
+        self.assertEqual(1, lru_cache.stats()['hits'])
+        self.assertEqual(1, lru_cache.stats()['misses'])
+
+    def test_least_recently_used_is_dropped(self):
+        lru_cache = cache.LRUCache('test', maxsize=2)
+        lru_cache.set('a', 1)
+        lru_cache.set('b', 2)
+        lru_cache.get('a')
+        lru_cache.set('c', 3)
+        self.assertEqual(1, lru_cache.get('a'))
+        self.assertIsNone(lru_cache.get('b'))
+        self.assertEqual(3, lru_cache.get('c'))
+
+    @mock.patch('time.time')
+    def test_entries_expire(self, mock_time):
+        lru_cache = cache.LRUCache('test', ttl=10)
+        mock_time.return_value = 100
+        lru_cache.set('a', 1)
+        mock_time.return_value = 105
+        self.assertEqual(1, lru_cache.get('a'))
+        mock_time.return_value = 111
+        self.assertIsNone(lru_cache.get('a'))
+
+    def test_invalidate(self):
+        lru_cache = cache.LRUCache('test')
+        lru_cache.set(('pkg-1', 'de'), 1)
+        lru_cache.set(('pkg-1', 'fr'), 2)
+        lru_cache.set(('pkg-2', 'de'), 3)
+        lru_cache.invalidate(lambda key: key[0] == 'pkg-1')
+        self.assertIsNone(lru_cache.get(('pkg-1', 'de')))
+        self.assertIsNone(lru_cache.get(('pkg-1', 'fr')))
+        self.assertEqual(3, lru_cache.get(('pkg-2', 'de')))
+
+    def test_invalidate_values(self):
+        lru_cache = cache.LRUCache('test')
+        lru_cache.set('identifier-1', {'id': 'pkg-1'})
+        lru_cache.set('identifier-2', {'id': 'pkg-1'})
+        lru_cache.set('identifier-3', {'id': 'pkg-2'})
+        lru_cache.invalidate_values(lambda value: value['id'] == 'pkg-1')
+        self.assertIsNone(lru_cache.get('identifier-1'))
+        self.assertIsNone(lru_cache.get('identifier-2'))
+        self.assertEqual({'id': 'pkg-2'}, lru_cache.get('identifier-3'))
+
+    def test_get_or_load(self):
+        lru_cache = cache.LRUCache('test')
+        loader = mock.Mock(return_value=1)
+        self.assertEqual(1, lru_cache.get_or_load('a', loader))
+        self.assertEqual(1, lru_cache.get_or_load('a', loader))
+        self.assertEqual(1, loader.call_count)
+
+    @mock.patch('threading.Thread')
+    @mock.patch('time.time')
+    def test_get_or_load_refreshes_in_background(self, mock_time,
+                                                 mock_thread):
+        lru_cache = cache.LRUCache('test', ttl=60)
+        mock_time.return_value = 100
+        lru_cache.set('a', 1)
+        mock_time.return_value = 140
+        self.assertEqual(1, lru_cache.get_or_load('a', mock.Mock(), 30))
+        self.assertTrue(mock_thread.return_value.start.called)
+
+    @mock.patch('ckanext.switzerland.cache.model')
+    def test_only_refresh_removes_session(self, mock_model):
+        lru_cache = cache.LRUCache('test')
+        lru_cache.get_or_load('a', mock.Mock(return_value=1))
+        self.assertFalse(mock_model.Session.remove.called)
+        lru_cache._refresh('a', mock.Mock(return_value=2))
+        self.assertTrue(mock_model.Session.remove.called)
+        self.assertEqual(2, lru_cache.get('a'))
+
+
+class TestMemoizePerRequest(unittest.TestCase):
+    @mock.patch('ckanext.switzerland.cache.get_request_memo')
+    def test_memoize_per_request(self, mock_get_request_memo):
+        mock_get_request_memo.return_value = {}
+        func = mock.Mock(return_value='org', __name__='func')
+        memoized = cache.memoize_per_request(func)
+        self.assertEqual('org', memoized('org-1'))
+        self.assertEqual('org', memoized('org-1'))
+        self.assertEqual('org', memoized('org-2'))
+        self.assertEqual(2, func.call_count)
+
+    @mock.patch('ckanext.switzerland.cache.get_request_memo')
+    def test_memoize_per_request_unhashable(self, mock_get_request_memo):
+        mock_get_request_memo.return_value = {}
+        func = mock.Mock(return_value='rights', __name__='func')
+        memoized = cache.memoize_per_request(func)
+        memoized({'resources': []})
+        memoized({'resources': []})
+        self.assertEqual(2, func.call_count)
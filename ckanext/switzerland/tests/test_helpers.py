@@ -49,6 +49,22 @@ class TestHelpers(unittest.TestCase):
         result = helpers.simplify_terms_of_use(term_id)
         self.assertEquals('ClosedData', result)
 
+    def test_get_least_open_terms_of_use(self):
+        resources = [
+            {'rights': 'NonCommercialAllowed-CommercialAllowed-ReferenceRequired'},  # noqa
+            {'rights': 'NonCommercialAllowed-CommercialWithPermission-ReferenceNotRequired'},  # noqa
+            {'rights': 'NonCommercialAllowed-CommercialAllowed-ReferenceNotRequired'},  # noqa
+            {},
+        ]
+        self.assertEquals(
+            'NonCommercialAllowed-CommercialWithPermission-ReferenceNotRequired',  # noqa
+            helpers.get_least_open_terms_of_use(resources))
+        self.assertEquals(
+            'ClosedData',
+            helpers.get_least_open_terms_of_use(resources + [{'rights': 'x'}]))
+        self.assertEquals(
+            'ClosedData', helpers.get_least_open_terms_of_use([{}]))
+
     def test_get_localized_value_dict(self):
         lang_dict = {
             'de': 'DE value',
@@ -179,3 +195,70 @@ class TestHelpers(unittest.TestCase):
              org['title'] == title),
             -1)
         return index
+
+    def test_get_reduction_plans(self):
+        plans = helpers.get_reduction_plans()
+        self.assertEqual(helpers.FIELD_MULTILINGUAL, plans['dataset']['title'])  # noqa
+        self.assertEqual(helpers.FIELD_MULTILINGUAL, plans['dataset']['keywords'])  # noqa
+        self.assertEqual(helpers.FIELD_JSON, plans['dataset']['contact_points'])  # noqa
+        self.assertEqual(helpers.FIELD_PLAIN, plans['dataset']['identifier'])  # noqa
+        self.assertEqual(helpers.FIELD_PLAIN, plans['dataset']['metadata_modified'])  # noqa
+        self.assertEqual(helpers.FIELD_MULTILINGUAL, plans['resource']['name'])  # noqa
+        self.assertEqual(helpers.FIELD_PLAIN, plans['resource']['download_url'])  # noqa
+        self.assertEqual(helpers.FIELD_PLAIN, plans['organization']['political_level'])  # noqa
+        self.assertEqual(helpers.FIELD_MULTILINGUAL, plans['group']['description'])  # noqa
+
+    def test_reduce_package(self):
+        pkg_dict = {
+            'identifier': '123',
+            'title': organization_title,
+            'contact_points': '[{"name": "Contact", "email": "a@b.ch"}]',
+            'organization': {
+                'name': 'swisstopo',
+                'title': organization_title,
+            },
+            'groups': [{
+                'name': 'geography',
+                'display_name': organization_title,
+            }],
+            'resources': [{
+                'title': organization_title,
+                'download_url': 'http://download.url',
+            }],
+        }
+        result = helpers.reduce_package(deepcopy(pkg_dict), 'fr')
+        self.assertEqual('123', result['identifier'])
+        self.assertEqual('Swisstopo FR', result['title'])
+        self.assertEqual('Contact', result['contact_points'][0]['name'])
+        self.assertEqual('Swisstopo FR', result['organization']['title'])
+        self.assertEqual('Swisstopo FR', result['groups'][0]['title'])
+        self.assertEqual('Swisstopo FR', result['resources'][0]['title'])
+
+        # without a language json is parsed but not reduced
+        result = helpers.reduce_package(deepcopy(pkg_dict))
+        self.assertEqual('Swisstopo DE', result['title']['de'])
+        self.assertEqual('Contact', result['contact_points'][0]['name'])
+
+    def test_map_to_valid_format(self):
+        format_index = helpers.build_format_index({
+            'CSV': ['csv', 'comma ...'],
+            'TSV': ['text/tab-separated-values'],
+            'TXT': ['text'],
+        })
+        self.assertEqual('CSV', helpers.map_to_valid_format(' CSV ', format_index))  # noqa
+        self.assertEqual('CSV', helpers.map_to_valid_format('text/csv', format_index))  # noqa
+        self.assertEqual('CSV', helpers.map_to_valid_format('.csv', format_index))  # noqa
+        self.assertEqual('CSV', helpers.map_to_valid_format('Comma ...', format_index))  # noqa
+        self.assertEqual('TSV', helpers.map_to_valid_format('text/tab-separated-values', format_index))  # noqa
+        self.assertEqual('TSV', helpers.map_to_valid_format('tab-separated-values', format_index))  # noqa
+        self.assertEqual('TXT', helpers.map_to_valid_format('text', format_index))  # noqa
+        self.assertIsNone(helpers.map_to_valid_format('cat/gif', format_index))  # noqa
+        self.assertIsNone(helpers.map_to_valid_format('', format_index))
+
+    @mock.patch('ckanext.switzerland.helpers.model')
+    @mock.patch('ckan.plugins.plugin_loaded', return_value=False)
+    def test_get_showcases_version_without_showcase_plugin(
+            self, mock_plugin_loaded, mock_model):
+        self.assertEqual('', helpers.get_showcases_version('pkg-1'))
+        self.assertEqual([], helpers.get_showcases_for_dataset('pkg-1'))
+        self.assertFalse(mock_model.Session.query.called)
@@ -0,0 +1,46 @@
+"""Tests for linkcheck.py."""
+from nose.tools import *  # noqa
+import ckanext.switzerland.linkcheck as linkcheck
+import sys
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestLinkcheck(unittest.TestCase):
+    def test_interleave_by_host(self):
+        urls = [
+            'https://a.example.com/1',
+            'https://a.example.com/2',
+            'https://a.example.com/3',
+            'https://b.example.com/1',
+            'http://c.example.com/1',
+        ]
+        self.assertEqual(
+            ['https://a.example.com/1',
+             'https://b.example.com/1',
+             'http://c.example.com/1',
+             'https://a.example.com/2',
+             'https://a.example.com/3'],
+            linkcheck.interleave_by_host(urls))
+
+    def test_get_media_type(self):
+        self.assertEqual(
+            'text/csv', linkcheck.get_media_type('text/CSV; charset=utf-8'))
+        self.assertEqual('', linkcheck.get_media_type(None))
+
+    def test_probe_urls(self):
+        def request(url):
+            if url.endswith('error'):
+                raise IOError('not reachable')
+            return {'status_code': 200}
+
+        results = sorted(linkcheck.probe_urls(
+            ['http://example.com/ok', 'http://example.com/error'],
+            request, threads=2, per_host=1))
+        self.assertEqual(
+            [('http://example.com/error', None, 'not reachable'),
+             ('http://example.com/ok', {'status_code': 200}, None)],
+            results)
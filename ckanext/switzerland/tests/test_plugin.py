@@ -202,3 +202,94 @@ class TestPlugin(unittest.TestCase):
         resource_with_comma_format_cleaned = ogdch_language_plugin._prepare_resource_format(
             resource_with_comma_format.copy())
         self.assertEquals('CSV', resource_with_comma_format_cleaned['format'])
+
+    def test_before_index_batch_shares_memo(self):
+        ogdch_package_plugin = plugin.OgdchPackagePlugin()
+        with mock.patch.object(ogdch_package_plugin, '_prepare_search_data',
+                               side_effect=lambda data, *args: data) \
+                as prepare_search_data:
+            docs = ogdch_package_plugin.before_index_batch(
+                [{'id': 'a'}, {'id': 'b'}])
+        self.assertEquals([{'id': 'a'}, {'id': 'b'}], docs)
+        memos = [call[0][1] for call in prepare_search_data.call_args_list]
+        self.assertIs(memos[0], memos[1])
+
+    def test_before_index_is_skipped_when_deferred(self):
+        ogdch_package_plugin = plugin.OgdchPackagePlugin()
+        with mock.patch.object(ogdch_package_plugin,
+                               '_prepare_search_data') as prepare_search_data:
+            with ogdch_package_plugin.deferred_before_index():
+                ogdch_package_plugin.before_index({'id': 'a'})
+            self.assertFalse(prepare_search_data.called)
+            ogdch_package_plugin.before_index({'id': 'a'})
+            self.assertTrue(prepare_search_data.called)
+
+    @mock.patch('ckanext.switzerland.helpers.model')
+    @mock.patch('ckan.plugins.plugin_loaded', return_value=False)
+    def test_index_without_showcase_plugin(self, mock_plugin_loaded,
+                                           mock_model):
+        ogdch_package_plugin = plugin.OgdchPackagePlugin()
+        search_data = ogdch_package_plugin._prepare_showcases_for_index(
+            {}, {'id': 'pkg-1'})
+        self.assertEquals('[]', search_data['showcases'])
+        self.assertEquals([], search_data['showcase_ids'])
+        self.assertFalse(search_data['has_showcase'])
+        self.assertFalse(mock_model.Session.query.called)
+
+    def test_get_format_for_index_memo_ignores_download_url_path(self):
+        ogdch_package_plugin = plugin.OgdchPackagePlugin()
+        memo = {'formats': {}, 'organizations': {}}
+        with mock.patch.object(ogdch_package_plugin,
+                               '_prepare_resource_format',
+                               return_value={'format': 'CSV'}) \
+                as prepare_resource_format:
+            for url in ['http://a.ch/1.csv', 'http://b.ch/2.csv']:
+                ogdch_package_plugin._get_format_for_index(
+                    {'format': 'csv', 'download_url': url}, memo)
+            ogdch_package_plugin._get_format_for_index(
+                {'format': 'csv', 'download_url': 'http://a.ch/3.xls'}, memo)
+        self.assertEquals(2, prepare_resource_format.call_count)
+
+    @mock.patch.object(plugin.OgdchLanguagePlugin, 'format_index',
+                       {'csv': 'CSV'})
+    @mock.patch.object(plugin.OgdchLanguagePlugin, 'format_index_mapping',
+                       {'CSV': ['csv']})
+    def test_get_format_index_uses_instance_mapping(self):
+        ogdch_language_plugin = plugin.OgdchLanguagePlugin()
+        ogdch_language_plugin.format_mapping = self._load_test_format_mapping()
+        format_index = ogdch_language_plugin.get_format_index()
+        self.assertNotEqual({'csv': 'CSV'}, format_index)
+        self.assertEquals({'csv': 'CSV'},
+                          plugin.OgdchLanguagePlugin.format_index)
+
+    @mock.patch.object(plugin.OgdchPackagePlugin, '_get_view_language',
+                       return_value='de')
+    def test_before_view_merges_cached_fields(self, mock_get_view_language):
+        def reduce_title(pkg_dict):
+            pkg_dict['title'] = pkg_dict['title']['de']
+            pkg_dict.pop('extras', None)
+            return pkg_dict
+
+        def package_dict(**kwargs):
+            pkg_dict = {'id': 'pkg-1', 'metadata_modified': '2020-01-01',
+                        'title': {'de': u'Titel', 'fr': u'Titre'},
+                        'extras': []}
+            pkg_dict.update(kwargs)
+            return pkg_dict
+
+        plugin.package_view_cache.clear()
+        ogdch_package_plugin = plugin.OgdchPackagePlugin()
+        with mock.patch.object(plugin.OgdchLanguagePlugin, 'before_view',
+                               side_effect=reduce_title) as before_view:
+            ogdch_package_plugin.before_view(package_dict())
+            pkg_dict = package_dict()
+            result = ogdch_package_plugin.before_view(pkg_dict)
+            self.assertEquals(1, before_view.call_count)
+            self.assertIs(pkg_dict, result)
+            self.assertEquals(u'Titel', result['title'])
+            self.assertNotIn('extras', result)
+
+            # a dict of another shape (e.g. a search result) is not served
+            # from the entry of the package_show dict
+            ogdch_package_plugin.before_view(package_dict(score=1.0))
+            self.assertEquals(2, before_view.call_count)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Tests for suggest.py."""
+from nose.tools import *  # noqa
+import ckanext.switzerland.suggest as suggest
+import sys
+
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.prefix_index = suggest.PrefixIndex([
+            u'Bundesamt für Statistik',
+            u'Statistisches Amt des Kantons Zürich',
+            u'CSV',
+        ])
+
+    def test_search_first_word(self):
+        self.assertEqual(
+            [u'Bundesamt für Statistik'],
+            self.prefix_index.search('bundes'))
+
+    def test_search_any_word(self):
+        self.assertEqual(
+            [u'Bundesamt für Statistik',
+             u'Statistisches Amt des Kantons Zürich'],
+            self.prefix_index.search('Stat'))
+
+    def test_search_ignores_accents(self):
+        self.assertEqual(
+            [u'Statistisches Amt des Kantons Zürich'],
+            self.prefix_index.search(u'zür'))
+        self.assertEqual(
+            [u'Bundesamt für Statistik'],
+            self.prefix_index.search('fur stat'))
+
+    def test_search_limit(self):
+        self.assertEqual(1, len(self.prefix_index.search('s', limit=1)))
+
+    def test_search_empty(self):
+        self.assertEqual([], self.prefix_index.search(' '))
@@ -175,8 +175,8 @@ def ogdch_unique_identifier(field, schema):
         id = data.get(key[:-1] + ('id',))
         identifier = data.get(key[:-1] + ('identifier',))
         try:
-            result = get_action('ogdch_dataset_by_identifier')(
-                {},
+            result = get_action('ogdch_dataset_name_by_identifier')(
+                {'use_cache': False},
                 {'identifier': identifier}
             )
             if id != result['id']: